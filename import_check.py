@@ -0,0 +1,98 @@
+"""
+Checks that the segmentation modules stay cheap to import. Talon reloads
+user scripts often, so slow imports (OpenCV especially) make editing laggy.
+Not actually used by Talon. Exits with an error if a check fails.
+"""
+
+if __name__ == "__main__":
+    # The above stops any of this from getting processed in the Talon environment
+    import subprocess
+    import sys
+
+    # Modules which must not pull in OpenCV when imported
+    CHECKED_MODULES = [
+        "src.areas",
+        "src.cache",
+        "src.config",
+        "src.corpus",
+        "src.grid",
+        "src.hierarchy",
+        "src.mask",
+        "src.projection",
+        "src.segment",
+        "src.spacing",
+        "src.spatial",
+        "src.types",
+        "src.worker",
+    ]
+    # Budget for the time spent importing our own modules (excluding numpy etc.)
+    OWN_IMPORT_BUDGET_MS = 20
+
+    # The explicit colors path must work without importing OpenCV at all
+    EXPLICIT_PATH_SCRIPT = """
+import sys
+import numpy as np
+from src.types import Image
+from src.mask import calculate_explicit_mask
+from src.projection import ProjectionIndex
+from src.segment import calculate_grouped_rects
+data = np.full((60, 200, 3), 255, dtype=np.uint8)
+data[20:30, 10:50] = 0
+data[20:30, 70:120] = 0
+groups = calculate_grouped_rects(ProjectionIndex(calculate_explicit_mask(Image(data), ["#ffffff"])))
+assert len(groups[0].word_rects) == 2, groups[0].word_rects
+assert "cv2" not in sys.modules, "explicit_colors path imported cv2"
+"""
+
+    def import_times(module):
+        """
+        Returns {module name: self time in microseconds} from -X importtime
+        """
+
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        times = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            times[name.strip()] = int(self_us)
+
+        return times
+
+    failures = []
+    own_total_us = 0
+    for module in CHECKED_MODULES:
+        times = import_times(module)
+        if "cv2" in times:
+            failures.append(f"import {module} pulls in cv2")
+        own_us = sum(
+            self_us
+            for name, self_us in times.items()
+            if name == "src" or name.startswith("src.")
+        )
+        own_total_us = max(own_total_us, own_us)
+        print(f"import {module}: {sum(times.values()) / 1000:.1f}ms total, {own_us / 1000:.1f}ms in src")
+
+    if own_total_us / 1000 > OWN_IMPORT_BUDGET_MS:
+        failures.append(
+            f"src modules took {own_total_us / 1000:.1f}ms to import, "
+            f"budget is {OWN_IMPORT_BUDGET_MS}ms"
+        )
+
+    explicit = subprocess.run(
+        [sys.executable, "-c", EXPLICIT_PATH_SCRIPT],
+        capture_output=True,
+        text=True
+    )
+    if explicit.returncode != 0:
+        failures.append(f"explicit_colors path check failed:\n{explicit.stderr}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,232 @@
+"""
+Mouse input for selecting and clicking on text. Applications take a variable
+amount of time to register a mouse drag, so rather than always sleeping for
+a fixed time this keeps a per app record of the delays that have worked.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import time
+
+import numpy as np
+from talon import actions, screen
+from talon.types import Rect
+
+
+class TimingProfile:
+    """
+    The input delays that have worked for a single application, along with
+    some statistics about how they've performed.
+    """
+
+    # After this many verified drags in a row work, a shorter delay is tried
+    STEP_DOWN_SUCCESSES = 8
+    # How much shorter the delay gets each time it steps down
+    STEP_DOWN_FACTOR = 0.75
+
+    def __init__(self, initial_delay: float, min_delay: float, max_delay: float):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        # The delay to use for the next attempt. Raised when a drag fails and
+        # lowered again once drags keep working, so a single slow drag
+        # doesn't slow down the app for good.
+        self.delay = initial_delay
+        # Whether delay has actually been confirmed to work by a verified drag
+        self.confirmed = False
+        self.attempts = 0
+        self.failures = 0
+        # Verified drags that have worked since the last failure or step down
+        self.successes_in_a_row = 0
+        self.latencies: List[float] = []
+
+    def record_success(self, delay: float, latency: float):
+        self.attempts += 1
+        self.latencies.append(latency)
+        if not self.confirmed or delay < self.delay:
+            self.delay = delay
+        self.confirmed = True
+
+        self.successes_in_a_row += 1
+        if self.successes_in_a_row >= self.STEP_DOWN_SUCCESSES:
+            self.successes_in_a_row = 0
+            self.delay = max(self.delay * self.STEP_DOWN_FACTOR, self.min_delay)
+
+    def record_failure(self, delay: float) -> float:
+        """
+        Records that the given delay didn't work and returns the delay to try
+        next.
+        """
+
+        self.attempts += 1
+        self.failures += 1
+        self.successes_in_a_row = 0
+        self.delay = min(max(delay * 2, self.min_delay), self.max_delay)
+        return self.delay
+
+    def stats(self) -> dict:
+        return {
+            "delay_ms": round(self.delay * 1000, 1),
+            "confirmed": self.confirmed,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "mean_latency_ms": (
+                round(float(np.mean(self.latencies)) * 1000, 1)
+                if self.latencies else None
+            ),
+        }
+
+
+class InputDriver:
+    """
+    Performs mouse drags and clicks using a TimingProfile for each
+    application.
+    """
+
+    # How long to wait for the application to draw a selection when verifying
+    VERIFY_TIMEOUT = 0.1
+    VERIFY_POLL_INTERVAL = 0.02
+
+    def __init__(
+            self,
+            initial_delay: float=0.02,
+            unverified_delay: float=0.1,
+            min_delay: float=0.005,
+            max_delay: float=0.4,
+            max_attempts: int=4):
+        """
+        Args:
+            initial_delay: The delay to start from when drags can be verified.
+            unverified_delay: The delay to use when drags can't be verified and
+              the application has no confirmed delay yet.
+            min_delay, max_delay: Bounds on the delays used.
+            max_attempts: How many times a verified drag will be tried.
+        """
+
+        self.initial_delay = initial_delay
+        self.unverified_delay = unverified_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.profiles: Dict[str, TimingProfile] = {}
+
+    def profile(self, app_name: str) -> TimingProfile:
+        if app_name not in self.profiles:
+            self.profiles[app_name] = TimingProfile(
+                self.initial_delay,
+                self.min_delay,
+                self.max_delay
+            )
+
+        return self.profiles[app_name]
+
+    def drag(
+            self,
+            app_name: str,
+            start: Tuple[float, float],
+            end: Tuple[float, float],
+            verify_rect: Optional[Rect]=None,
+            selection_color: Optional[str]=None,
+            fixed_delay: Optional[float]=None) -> bool:
+        """
+        Drags the mouse from start to end. If a verify_rect and selection_color
+        are given then the drag is checked by looking for the selection color
+        in the rect afterwards, and retried with a longer delay on failure.
+        Returns False if the drag couldn't be verified.
+        """
+
+        profile = self.profile(app_name)
+        can_verify = (
+            verify_rect is not None and
+            selection_color is not None and
+            # If it's already selected we can't tell whether the drag worked
+            not self._has_color(verify_rect, selection_color)
+        )
+        if fixed_delay is not None:
+            delay = fixed_delay
+        elif can_verify or profile.confirmed:
+            delay = profile.delay
+        else:
+            delay = self.unverified_delay
+
+        for _ in range(self.max_attempts):
+            start_time = time.perf_counter()
+            self._drag_once(start, end, delay)
+            if not can_verify:
+                return True
+
+            if self._selection_visible(verify_rect, selection_color):
+                if fixed_delay is None:
+                    profile.record_success(delay, time.perf_counter() - start_time)
+                return True
+
+            if fixed_delay is None:
+                delay = profile.record_failure(delay)
+
+        return False
+
+    def click(
+            self,
+            app_name: str,
+            pos: Tuple[float, float],
+            button: int=0,
+            fixed_delay: Optional[float]=None):
+        """
+        Clicks at the given position, waiting long enough for the application
+        to register the click before the caller moves the mouse elsewhere.
+        """
+
+        profile = self.profile(app_name)
+        if fixed_delay is not None:
+            delay = fixed_delay
+        elif profile.confirmed:
+            delay = profile.delay
+        else:
+            delay = self.unverified_delay
+
+        actions.mouse_move(*pos)
+        actions.mouse_click(button)
+        time.sleep(delay)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            app_name: profile.stats()
+            for app_name, profile in self.profiles.items()
+        }
+
+    def _drag_once(self, start, end, delay: float):
+        actions.mouse_move(*start)
+        actions.mouse_drag(0)
+        time.sleep(delay)
+        actions.mouse_move(*end)
+        actions.mouse_release(0)
+
+    def _selection_visible(self, rect: Rect, selection_color: str) -> bool:
+        """
+        Polls a capture of the given rect until the selection color appears
+        in it, or VERIFY_TIMEOUT passes.
+        """
+
+        deadline = time.perf_counter() + self.VERIFY_TIMEOUT
+        while not self._has_color(rect, selection_color):
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(self.VERIFY_POLL_INTERVAL)
+
+        return True
+
+    def _has_color(self, rect: Rect, color: str) -> bool:
+        img = np.array(screen.capture(
+            int(rect.x),
+            int(rect.y),
+            max(int(rect.width), 1),
+            max(int(rect.height), 1)
+        ))
+        return bool((img[:, :, :3] == _decode_hex(color)).all(axis=2).any())
+
+
+def _decode_hex(hexstr: str) -> List[int]:
+    """
+    Turns a RGB hex string like #aabbff into a RGB list [170, 187, 255]
+    """
+
+    return [int(hexstr[i:i+2], 16) for i in (1, 3, 5)]
@@ -0,0 +1,13 @@
+"""
+Command line tool for measuring telector_show and telector_select end to end
+outside of Talon, using the stand-in talon package in talon_stub. Reports
+the time spent in each phase, from parsing the settings through to drawing
+the labels, at several window sizes and word counts or on given
+screenshots. Not actually used by Talon. Run with --help for the options.
+"""
+
+if __name__ == "__main__":
+    # The above stops any of this from getting processed in the Talon environment
+    from talon_stub.harness import main
+
+    main()
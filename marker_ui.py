@@ -2,7 +2,7 @@
 The GUI code
 """
 
-from typing import List, NamedTuple, Optional
+from typing import List, NamedTuple, Optional, Sequence
 
 import re
 
@@ -22,7 +22,11 @@ class MarkerUi:
         target_region: Rect
         label: str
 
-    def __init__(self, markers: List[Marker]=[], offset_downward=False, screen_idx=0):
+    # Room around the target regions for the label boxes, which can be larger
+    # than small targets
+    CANVAS_MARGIN = 20
+
+    def __init__(self, markers: List[Marker]=[], offset_downward=False, target_screens=None):
         """
         Args:
 
@@ -30,11 +34,17 @@ class MarkerUi:
             offset_downward: If true, then shift the markers so they don't cover the top
               half of the target region. This can make text readable even when the marker
               is showing.
-            screen_idx: The Talon screen index we're showing the markers on.
+            target_screens: The Talon screens we're showing the markers on. Defaults to
+              the ones the markers are on.
         """
 
         self.markers = markers
-        self.can = canvas.Canvas.from_screen(ui.screens()[screen_idx])
+        self.can = canvas.Canvas.from_rect(canvas_rect(
+            [marker.target_region for marker in markers],
+            self.CANVAS_MARGIN,
+            self.CANVAS_MARGIN,
+            target_screens
+        ))
         self.can.register("draw", self._draw)
         self.can.hide()
         self.offset_downward = offset_downward
@@ -112,16 +122,28 @@ class UnderlineMarkerUi:
     class Group(NamedTuple):
         label: str
         line_rect: Rect
-        item_rects: List[Rect]
+        # Any sequence will do, e.g. one that calculates the rects on first use
+        item_rects: Sequence[Rect]
+
+    # Room around the lines for the line labels to the left or right and the
+    # underlines below
+    CANVAS_MARGIN_X = 40
+    CANVAS_MARGIN_Y = 10
 
-    def __init__(self, groups: List[Group]=[], screen_idx=0):
+    def __init__(self, groups: List[Group]=[], target_screens=None):
         """
         Args:
             groups: List of groups of item rectangles with a label for the whole group.
-            screen_idx: The Talon screen index we're showing the markers on.
+            target_screens: The Talon screens we're showing the markers on. Defaults to
+              the ones the groups are on.
         """
         self.groups = groups
-        self.can = canvas.Canvas.from_screen(ui.screens()[screen_idx])
+        self.can = canvas.Canvas.from_rect(canvas_rect(
+            [group.line_rect for group in groups],
+            self.CANVAS_MARGIN_X,
+            self.CANVAS_MARGIN_Y,
+            target_screens
+        ))
         self.can.register("draw", self._draw)
         self.can.hide()
         self.visible = False
@@ -164,9 +186,10 @@ class UnderlineMarkerUi:
         paint = canvas.paint
         paint.style = paint.Style.STROKE
 
-        # Should we draw line labels on the left or the right of the line?
+        # Should we draw line labels on the left or the right of the line? The
+        # canvas only stops short of the margin on the left at the screen edge.
         labels_on_left = all(
-            (group.line_rect.x - 20) > 0
+            (group.line_rect.x - 20) > self.can.rect.x
             for group in self.groups
         )
 
@@ -230,6 +253,54 @@ class UnderlineMarkerUi:
             bg_rect.y - trect.y + (bg_rect.height - trect.height) / 2
         )
 
+def canvas_rect(rects: List[Rect], margin_x: int, margin_y: int, target_screens=None) -> Rect:
+    """
+    Finds the rect for a canvas covering all the given rects plus a margin,
+    clipped to the screens they're on. Canvas allocation and painting costs
+    scale with its size, so this is much cheaper than a full screen canvas for
+    small text areas. Drawing still uses screen coordinates.
+    """
+
+    if len(rects) == 0:
+        screen_rect = (target_screens or ui.screens())[0].rect
+        return Rect(screen_rect.x, screen_rect.y, 1, 1)
+
+    x1 = min(rect.x for rect in rects) - margin_x
+    y1 = min(rect.y for rect in rects) - margin_y
+    x2 = max(rect.x + rect.width for rect in rects) + margin_x
+    y2 = max(rect.y + rect.height for rect in rects) + margin_y
+
+    if target_screens is None:
+        target_screens = _find_screens(Rect(x1, y1, x2 - x1, y2 - y1))
+    # Clipped to all the screens together, so regions on different screens
+    # share one canvas
+    screen_rects = [target_screen.rect for target_screen in target_screens]
+    x1 = max(x1, min(screen_rect.x for screen_rect in screen_rects))
+    y1 = max(y1, min(screen_rect.y for screen_rect in screen_rects))
+    x2 = min(x2, max(screen_rect.x + screen_rect.width for screen_rect in screen_rects))
+    y2 = min(y2, max(screen_rect.y + screen_rect.height for screen_rect in screen_rects))
+
+    return Rect(x1, y1, max(x2 - x1, 1), max(y2 - y1, 1))
+
+
+def _find_screens(extent: Rect):
+    """
+    Finds the screens overlapping the given rect, falling back to the main
+    screen.
+    """
+
+    screens = ui.screens()
+    overlapping = [
+        target_screen
+        for target_screen in screens
+        for screen_rect in (target_screen.rect,)
+        if screen_rect.x < extent.x + extent.width and extent.x < screen_rect.x + screen_rect.width
+        and screen_rect.y < extent.y + extent.height and extent.y < screen_rect.y + screen_rect.height
+    ]
+
+    return overlapping or screens[:1]
+
+
 if False:
     # Testing code, set above to True to activate
     def _make_markers():
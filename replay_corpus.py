@@ -0,0 +1,12 @@
+"""
+Command line tool for replaying frames recorded with the
+user.telector_record_dir setting through the segmentation algorithm,
+comparing the results and timings with those recorded. Not actually used by
+Talon. Run with --help for the options.
+"""
+
+if __name__ == "__main__":
+    # The above stops any of this from getting processed in the Talon environment
+    from src.corpus import main
+
+    main()
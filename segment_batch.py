@@ -0,0 +1,11 @@
+"""
+Command line tool for running the line and word segmentation algorithm over
+many saved screenshots, e.g. for regression testing. Not actually used by
+Talon. Run with --help for the options.
+"""
+
+if __name__ == "__main__":
+    # The above stops any of this from getting processed in the Talon environment
+    from src.batch import main
+
+    main()
@@ -6,12 +6,12 @@ by Talon
 if __name__ == "__main__":
     # The above stops any of thise from getting processed in the Talon environment
     import cv2
-    import numpy as np
 
     from src.types import Image, Mask, Rect
     from src.mask import calculate_floodfill_mask, calculate_explicit_mask
     from src.cursor import find_cursor_by_difference
     from src.segment import calculate_line_rects, calculate_word_rects
+    from src.batch import render_mask
 
 
     def load_image(input_filename):
@@ -23,13 +23,7 @@ if __name__ == "__main__":
 
 
     def save_mask(mask: Mask, output_filename):
-        # Couldn't work out how to easily turn a mask bitmap into the OpenCV image
-        # format with numpy directly... This is fast enough.
-        output = np.zeros((mask.data.shape[0], mask.data.shape[1], 3))
-        for y in range(mask.data.shape[0]):
-            for x in range(mask.data.shape[1]):
-                output[y,x,:] = [255, 255, 255] if mask.data[y,x] else [0, 0, 0]
-        return cv2.imwrite(output_filename, output)
+        return cv2.imwrite(output_filename, render_mask(mask))
 
 
     def draw_rect(image: Image, rect: Rect):
@@ -0,0 +1,204 @@
+"""
+Finding the parts of a window which contain text, so masking and
+segmentation can be confined to them rather than run over toolbars, margins
+and empty space.
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .projection import ProjectionIndex
+from .types import Image, Mask, Rect
+
+
+# Side of the square blocks the image is reduced to, in pixels
+BLOCK_SIZE = 8
+# How many pixels of a block must be on both a horizontal and a vertical edge
+# for it to look like text. Rules and borders are only edges in one
+# direction, so don't count.
+MIN_BLOCK_EDGES = 3
+# Minimum difference in grey level for neighbouring pixels to be an edge
+EDGE_THRESHOLD = 32
+# Half the width and height, in blocks, of the neighbourhood each block's
+# text density is measured over. Wide enough to bridge the gaps between
+# words and lines.
+DENSITY_RADIUS = (3, 2)
+# Fraction of the neighbourhood which must look like text
+MIN_DENSITY = 0.2
+# Areas with fewer blocks than this are too small to be worth a region,
+# e.g. a lone button label
+MIN_AREA_BLOCKS = 24
+# Widest gap, in blocks, bridged when following a row of text out of an
+# area. The ends of long lines are often too sparse to be dense themselves.
+ROW_GAP_BLOCKS = 6
+
+
+def find_text_areas(image: Image) -> List[Rect]:
+    """
+    Rects around the text dense areas of the image, largest first. Works on
+    a block by block map of where there are edges in both directions, which
+    is smoothed with summed-area table box sums so nearby blocks of text join
+    up into one area.
+    """
+
+    # OpenCV is slow to import and only needed here, so only import it on
+    # first use
+    import cv2
+
+    text_blocks = _text_blocks(image)
+    rows, cols = text_blocks.shape
+    if rows == 0 or cols == 0:
+        return []
+
+    # Density of text blocks around each block
+    radius_x, radius_y = DENSITY_RADIUS
+    table = ProjectionIndex(Mask(text_blocks)).table
+    ys = np.arange(rows)
+    xs = np.arange(cols)
+    y1 = np.maximum(ys - radius_y, 0)[:, np.newaxis]
+    y2 = np.minimum(ys + radius_y + 1, rows)[:, np.newaxis]
+    x1 = np.maximum(xs - radius_x, 0)[np.newaxis, :]
+    x2 = np.minimum(xs + radius_x + 1, cols)[np.newaxis, :]
+    counts = table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+    density = counts / ((y2 - y1) * (x2 - x1))
+    dense = (density >= MIN_DENSITY).astype(np.uint8)
+
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(dense, connectivity=8)
+
+    # The dense areas spread past the text by up to the density radius, so
+    # use the extent of the text blocks in each instead. Each area is then
+    # widened to whole rows of text below.
+    ys, xs = text_blocks.nonzero()
+    block_labels = labels[ys, xs]
+    lefts = np.full(count, cols)
+    tops = np.full(count, rows)
+    rights = np.zeros(count, dtype=np.int64)
+    bottoms = np.zeros(count, dtype=np.int64)
+    np.minimum.at(lefts, block_labels, xs)
+    np.minimum.at(tops, block_labels, ys)
+    np.maximum.at(rights, block_labels, xs + 1)
+    np.maximum.at(bottoms, block_labels, ys + 1)
+
+    run_ids, run_starts, run_ends = _row_runs(text_blocks)
+    height, width = image.data.shape[:2]
+    areas = []
+    # Label 0 is everything that isn't dense
+    for label in range(1, count):
+        area = stats[label, cv2.CC_STAT_AREA]
+        if area < MIN_AREA_BLOCKS or rights[label] == 0:
+            continue
+
+        # Take in the whole of every row of text the area has part of
+        runs = np.unique(run_ids[tops[label]:bottoms[label], lefts[label]:rights[label]])
+        runs = runs[runs > 0] - 1
+        if len(runs) > 0:
+            lefts[label] = min(lefts[label], run_starts[runs].min())
+            rights[label] = max(rights[label], run_ends[runs].max())
+
+        # Pad by a block, since a glyph's edges can fall in a neighbouring
+        # block without enough edges to count as text
+        areas.append((area, Rect(
+            max(int(lefts[label] - 1) * BLOCK_SIZE, 0),
+            max(int(tops[label] - 1) * BLOCK_SIZE, 0),
+            min(int(rights[label] + 1) * BLOCK_SIZE, width),
+            min(int(bottoms[label] + 1) * BLOCK_SIZE, height),
+        )))
+
+    # Largest first, dropping any that are inside a larger one, e.g. a line
+    # indented far enough to split off from its paragraph, or the sparse end
+    # of a long line
+    areas.sort(key=lambda item: -item[0])
+    rects = []
+    for _, rect in areas:
+        if not any(_contains(outer, rect) for outer in rects):
+            rects.append(rect)
+
+    return rects
+
+
+def choose_text_area(areas: List[Rect], point: Optional[Tuple[int, int]]) -> Optional[Rect]:
+    """
+    The area containing the point if there is one, otherwise the first (i.e.
+    largest) area. None if there are no areas.
+    """
+
+    if point is not None:
+        x, y = point
+        for rect in areas:
+            if rect.x1 <= x < rect.x2 and rect.y1 <= y < rect.y2:
+                return rect
+
+    return areas[0] if len(areas) > 0 else None
+
+
+def _contains(outer: Rect, inner: Rect) -> bool:
+    return (
+        outer.x1 <= inner.x1 and inner.x2 <= outer.x2 and
+        outer.y1 <= inner.y1 and inner.y2 <= outer.y2
+    )
+
+
+def _row_runs(text_blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits each row of text blocks into runs, bridging gaps of up to
+    ROW_GAP_BLOCKS. Returns a (rows, cols) array giving each block's run
+    number plus one (0 outside any run), and the first and after last
+    columns of each run.
+    """
+
+    rows, cols = text_blocks.shape
+    padded = np.zeros((rows, cols + ROW_GAP_BLOCKS + 2), dtype=np.int8)
+    padded[:, 1:cols + 1] = text_blocks
+
+    # Fill in the short gaps. A column is in a gap when there's a text block
+    # within ROW_GAP_BLOCKS on both sides of it.
+    table = np.cumsum(padded, axis=1)
+    columns = np.arange(1, cols + 1)
+    before = table[:, columns] - table[:, np.maximum(columns - ROW_GAP_BLOCKS - 1, 0)]
+    after = table[:, columns + ROW_GAP_BLOCKS] - table[:, columns - 1]
+    filled = np.zeros_like(padded)
+    filled[:, 1:cols + 1] = (before > 0) & (after > 0)
+
+    edges = np.diff(filled, axis=1)
+    _, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    run_ids = np.cumsum(edges == 1, axis=None).reshape(edges.shape)[:, :cols]
+    run_ids = np.where(filled[:, 1:cols + 1] > 0, run_ids, 0)
+
+    return run_ids, starts, ends
+
+
+def _text_blocks(image: Image) -> np.ndarray:
+    """
+    Which BLOCK_SIZE square blocks of the image have both horizontal and
+    vertical edges in them, as a (rows, cols) bool array. Partial blocks at
+    the right and bottom are dropped.
+    """
+
+    import cv2
+
+    height, width = image.data.shape[:2]
+    rows = height // BLOCK_SIZE
+    cols = width // BLOCK_SIZE
+    gray = cv2.cvtColor(np.ascontiguousarray(image.data), cv2.COLOR_RGB2GRAY)
+    gray = gray[:rows * BLOCK_SIZE, :cols * BLOCK_SIZE]
+
+    # 255 where a pixel differs from the one right of or below it. The last
+    # column or row of pixels has no neighbour, so never counts.
+    edges_x = np.zeros(gray.shape, dtype=np.uint8)
+    edges_y = np.zeros(gray.shape, dtype=np.uint8)
+    _, edges_x[:, :-1] = cv2.threshold(
+        cv2.absdiff(gray[:, 1:], gray[:, :-1]), EDGE_THRESHOLD, 255, cv2.THRESH_BINARY)
+    _, edges_y[:-1, :] = cv2.threshold(
+        cv2.absdiff(gray[1:, :], gray[:-1, :]), EDGE_THRESHOLD, 255, cv2.THRESH_BINARY)
+
+    # Area averaging gives each block the count of its edge pixels scaled to
+    # 0-255 and rounded, so compare against a threshold halfway to the next
+    # count down
+    min_average = (MIN_BLOCK_EDGES - 0.5) * 255 / BLOCK_SIZE ** 2
+    size = (cols, rows)
+    return (
+        (cv2.resize(edges_x, size, interpolation=cv2.INTER_AREA) >= min_average) &
+        (cv2.resize(edges_y, size, interpolation=cv2.INTER_AREA) >= min_average)
+    )
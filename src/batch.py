@@ -0,0 +1,283 @@
+"""
+Runs the mask and segmentation functions over many saved screenshots outside
+of Talon. Used by segment_batch.py, the worker functions live here so they
+can be pickled by the process pool.
+
+Talon loads this file along with the rest of the package, so OpenCV is only
+imported inside the functions that need it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterable, List, NamedTuple, Optional
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .config import calculate_mask_from_config
+from .corpus import groups_to_lists
+from .projection import ProjectionIndex
+from .segment import calculate_grouped_rects
+from .types import Image, Mask, Rect
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class BatchOptions(NamedTuple):
+    # A background detector setting as used in Talon, except that mouse_fill
+    # can't be used as there's no mouse
+    background_detector: str = "pixel_fill:-10 -10"
+    selection_colors: Optional[List[str]] = None
+    # None to automatically determine word spacing
+    word_spacing: Optional[int] = None
+    # Whether to look for a fixed width character grid
+    detect_grid: bool = True
+    overlay_dir: Optional[str] = None
+    mask_dir: Optional[str] = None
+
+
+def iter_input_files(patterns: Iterable[str]) -> Iterable[str]:
+    """
+    Expands a list of files, directories (searched recursively) and glob
+    patterns into image filenames.
+    """
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, filenames in sorted(os.walk(pattern)):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, filename)
+        else:
+            for filename in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(filename):
+                    yield filename
+
+
+def load_image(filename: str) -> Image:
+    """
+    Loads an image file as an RGB Image, the same channel order as Talon's
+    screen captures, so colors can be copied from Talon settings.
+    """
+
+    import cv2
+
+    data = cv2.imread(filename)
+    if data is None:
+        raise ValueError(f"Couldn't read image {filename}")
+
+    return Image(cv2.cvtColor(data, cv2.COLOR_BGR2RGB))
+
+
+def render_mask(mask: Mask):
+    """
+    Turns a mask into a black and white BGR image (white is foreground).
+    """
+
+    return np.repeat(mask.data[:, :, np.newaxis], 3, axis=2).astype(np.uint8) * 255
+
+
+def render_overlay(image: Image, rects: List[Rect]):
+    """
+    Draws a red outline around each of the given rects on a BGR copy of the
+    image.
+    """
+
+    import cv2
+
+    output = cv2.cvtColor(image.data, cv2.COLOR_RGB2BGR)
+    if len(rects) == 0:
+        return output
+
+    coords = np.array([
+        (rect.x1, rect.y1, rect.x2, rect.y2)
+        for rect in rects
+    ])
+    x1s, y1s, x2s, y2s = coords.T
+    # The outline is drawn with one polylines call rather than a
+    # cv2.rectangle call per rect
+    outlines = np.stack([
+        np.stack([x1s, y1s], axis=1),
+        np.stack([x2s, y1s], axis=1),
+        np.stack([x2s, y2s], axis=1),
+        np.stack([x1s, y2s], axis=1),
+    ], axis=1).astype(np.int32)
+    cv2.polylines(output, list(outlines), True, (0, 0, 255), 1)
+
+    return output
+
+
+def process_file(filename: str, options: BatchOptions) -> dict:
+    """
+    Runs masking and segmentation over a single file, returning a JSON
+    friendly dict with the found rects and how long each stage took. If the
+    file can't be loaded or segmented the dict just has the error instead,
+    so one bad file doesn't stop the rest of a batch.
+    """
+
+    try:
+        return _process_file(filename, options)
+    except Exception as e:  # pylint:disable=broad-except
+        return {"file": filename, "error": str(e) or type(e).__name__}
+
+
+def _process_file(filename: str, options: BatchOptions) -> dict:
+    import cv2
+
+    timings = {}
+    start = time.perf_counter()
+
+    def _lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = round((now - start) * 1000, 3)
+        start = now
+
+    image = load_image(filename)
+    _lap("load_ms")
+
+    height, width, _ = image.data.shape
+    mask = calculate_mask_from_config(
+        image,
+        options.background_detector,
+        selection_colors=options.selection_colors
+    )
+    _lap("mask_ms")
+
+    index = ProjectionIndex(mask)
+    _lap("index_ms")
+
+    groups = calculate_grouped_rects(
+        index,
+        word_whitespace_threshold=options.word_spacing,
+        detect_grid=options.detect_grid
+    )
+    # Word rects are calculated lazily, make sure they're included in the timing
+    for group in groups:
+        group.word_rects
+    _lap("segment_ms")
+
+    basename = os.path.splitext(os.path.basename(filename))[0]
+    if options.mask_dir is not None:
+        cv2.imwrite(
+            os.path.join(options.mask_dir, f"{basename}.png"),
+            render_mask(mask)
+        )
+    if options.overlay_dir is not None:
+        cv2.imwrite(
+            os.path.join(options.overlay_dir, f"{basename}.png"),
+            render_overlay(image, [
+                rect
+                for group in groups
+                for rect in group.word_rects
+            ])
+        )
+    if options.mask_dir is not None or options.overlay_dir is not None:
+        _lap("render_ms")
+
+    return {
+        "file": filename,
+        "size": [width, height],
+        "lines": groups_to_lists(groups),
+        "timings": timings,
+    }
+
+
+def main(argv: List[str]=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Runs telector's line and word segmentation over saved screenshots "
+            "and prints the results as JSON lines."
+        )
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Image files, directories or glob patterns"
+    )
+    parser.add_argument(
+        "--background-detector",
+        help=(
+            "A background detector setting as used in Talon, e.g. dominant_colors "
+            "or pixel_fill:10 10. Overrides --flood-point and --explicit-colors."
+        )
+    )
+    parser.add_argument(
+        "--flood-point",
+        nargs=2,
+        default=["-10", "-10"],
+        metavar=("X", "Y"),
+        help="Flood fill start point, negative values are relative to the right/bottom"
+    )
+    parser.add_argument(
+        "--explicit-colors",
+        nargs="+",
+        metavar="COLOR",
+        help="Background colors like #ffffff, used instead of flood filling"
+    )
+    parser.add_argument(
+        "--selection-colors",
+        nargs="+",
+        metavar="COLOR",
+        help="Text selection background colors"
+    )
+    parser.add_argument(
+        "--word-spacing",
+        type=int,
+        default=-1,
+        help="Word break whitespace width in pixels, -1 to determine automatically"
+    )
+    parser.add_argument(
+        "--no-grid",
+        action="store_true",
+        help="Don't segment fixed width text using its character grid"
+    )
+    parser.add_argument("--overlay-dir", help="Write images with the word rects drawn on here")
+    parser.add_argument("--mask-dir", help="Write the foreground masks here")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes"
+    )
+    args = parser.parse_args(argv)
+
+    for directory in (args.overlay_dir, args.mask_dir):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    if args.background_detector is not None:
+        background_detector = args.background_detector
+    elif args.explicit_colors:
+        background_detector = "explicit_colors:" + " ".join(args.explicit_colors)
+    else:
+        background_detector = "pixel_fill:" + " ".join(args.flood_point)
+
+    options = BatchOptions(
+        background_detector=background_detector,
+        selection_colors=args.selection_colors,
+        word_spacing=None if args.word_spacing == -1 else args.word_spacing,
+        detect_grid=not args.no_grid,
+        overlay_dir=args.overlay_dir,
+        mask_dir=args.mask_dir,
+    )
+    filenames = list(iter_input_files(args.inputs))
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        results = executor.map(
+            process_file,
+            filenames,
+            repeat(options),
+            chunksize=max(1, len(filenames) // (args.jobs * 4))
+        )
+        for result in results:
+            sys.stdout.write(json.dumps(result) + "\n")
+            sys.stdout.flush()
+
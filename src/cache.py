@@ -0,0 +1,113 @@
+"""
+A cache of the most recent segmentation result, so several queries about the
+same screen contents only capture and segment it once.
+"""
+
+from typing import Hashable, List, NamedTuple, Optional
+
+import threading
+import zlib
+
+from .mask import BackgroundPalette
+from .projection import ProjectionIndex
+from .segment import LineGroup, TextLayout
+from .types import Image
+
+
+class CachedSegmentation(NamedTuple):
+    # Whatever identifies the capture region and settings used
+    key: Hashable
+    # Checksum of the captured pixels
+    fingerprint: int
+    # When the result was last known to match the screen
+    timestamp: float
+    # None if the segmentation was done by a worker process, or for a text
+    # area within the capture region
+    index: Optional[ProjectionIndex]
+    groups: List[LineGroup]
+    # What's needed to segment some lines again in sticky mode, if kept
+    palette: Optional[BackgroundPalette] = None
+    layout: Optional[TextLayout] = None
+
+
+class SegmentationCache:
+    """
+    Holds a single CachedSegmentation. Results younger than max_age are
+    returned without looking at the screen, older ones are only reused if a
+    new capture has identical pixels.
+    """
+
+    def __init__(self, max_age: float=0.5):
+        self.max_age = max_age
+        self._entry: Optional[CachedSegmentation] = None
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, now: float) -> Optional[CachedSegmentation]:
+        """
+        Returns the cached result if it's for the given key and recent enough
+        to be trusted without a new capture.
+        """
+
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry.key != key:
+                return None
+            if now - entry.timestamp > self.max_age:
+                return None
+
+            return entry
+
+    def validate(self, key: Hashable, image: Image, now: float) -> Optional[CachedSegmentation]:
+        """
+        Returns the cached result if it's for the given key and the given
+        capture is identical to the one it was made from.
+        """
+
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry.key != key:
+                return None
+            if entry.fingerprint != fingerprint(image):
+                return None
+
+            self._entry = entry._replace(timestamp=now)
+            return self._entry
+
+    def put(
+            self,
+            key: Hashable,
+            image: Image,
+            index: ProjectionIndex,
+            groups: List[LineGroup],
+            now: float,
+            palette: Optional[BackgroundPalette]=None,
+            layout: Optional[TextLayout]=None) -> CachedSegmentation:
+        entry = CachedSegmentation(
+            key=key,
+            fingerprint=fingerprint(image),
+            timestamp=now,
+            index=index,
+            groups=groups,
+            palette=palette,
+            layout=layout
+        )
+        with self._lock:
+            self._entry = entry
+
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+
+
+def fingerprint(image: Image) -> int:
+    """
+    A cheap checksum of an Image's pixels
+    """
+
+    data = image.data
+    if not data.flags.c_contiguous:
+        data = data.copy()
+
+    return zlib.crc32(data) ^ hash(data.shape)
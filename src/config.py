@@ -0,0 +1,121 @@
+"""
+Functions for interpreting the settings strings used to configure the
+scripts. Kept separate from the Talon interface so saved captures can be
+processed with the same settings outside of Talon.
+"""
+
+from typing import List, Optional, Tuple
+
+from .mask import (
+    BackgroundPalette,
+    calculate_floodfill_mask_and_palette,
+    explicit_palette,
+    calculate_dominant_color_mask_and_palette
+)
+from .types import Image, Mask
+
+
+def calculate_relative(modifier: str, start: int, end: int) -> int:
+    """
+    Helper method for settings. Lets you specify numbers relative to a
+    range. For example:
+
+        calculate_relative("-10", 0, 100) == 90
+        calculate_relative("10", 0, 100) == 10
+        calculate_relative("-0", 0, 100) == 100
+    """
+    if modifier.startswith("-"):
+        modifier_ = int(modifier[1:])
+        rel_end = True
+    else:
+        modifier_ = int(modifier)
+        rel_end = False
+
+    if rel_end:
+        return end - modifier_
+    else:
+        return start + modifier_
+
+
+def calculate_mask_from_config(
+        image: Image,
+        config: str,
+        selection_colors: Optional[List[str]]=None) -> Mask:
+    """
+    Calculates a mask for the image using a background detector setting. The
+    setting must not depend on Talon's state, i.e. mouse_fill must already
+    have been turned into pixel_fill. Text selected with any of the
+    selection_colors as its background is treated like unselected text.
+    """
+
+    return calculate_mask_and_palette_from_config(image, config, selection_colors)[0]
+
+
+def calculate_mask_and_palette_from_config(
+        image: Image,
+        config: str,
+        selection_colors: Optional[List[str]]=None) -> Tuple[Mask, BackgroundPalette]:
+    """
+    Like calculate_mask_from_config, but also gives the BackgroundPalette the
+    background detector found, which can mask parts of the image captured
+    again without looking at the rest.
+    """
+
+    height, width, _ = image.data.shape
+
+    if config.startswith("pixel_fill"):
+        bits = config.split(":")
+        mods = bits[1].split(" ") if len(bits) > 1 else ["0", "0"]
+        return calculate_floodfill_mask_and_palette(
+            image,
+            (
+                calculate_relative(mods[0], 0, width),
+                calculate_relative(mods[1], 0, height),
+            ),
+            selection_colors=selection_colors
+        )
+    elif config.startswith("explicit_colors"):
+        _, colors_str = config.split(":")
+        colors = colors_str.split(" ")
+        palette = explicit_palette(
+            image,
+            colors,
+            selection_colors=selection_colors
+        )
+        return palette.mask(image), palette
+    elif config.startswith("dominant_colors"):
+        bits = config.split(":")
+        min_coverage = float(bits[1]) if len(bits) > 1 and bits[1].strip() != "" else 0.1
+        return calculate_dominant_color_mask_and_palette(
+            image,
+            min_coverage,
+            selection_colors=selection_colors
+        )
+    else:
+        raise ValueError(f"Unknown background detector: {config}")
+
+
+def parse_region_specs(config: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    Splits a regions setting into (bounding box, background detector) pairs.
+    Regions are separated by semicolons, and each is a bounding box setting
+    optionally followed by a pipe and a background detector setting. For
+    example:
+
+        "active_window:0 0 -300 -0 | explicit_colors:#ffffff; active_window:-300 0 -0 -0"
+
+    The background detector is None if a region doesn't give one.
+    """
+
+    specs = []
+    for region in config.split(";"):
+        if region.strip() == "":
+            continue
+
+        bounding_box, _, background_detector = region.partition("|")
+        specs.append((
+            bounding_box.strip(),
+            background_detector.strip() or None
+        ))
+
+    return specs
@@ -0,0 +1,255 @@
+"""
+An append-only store of captured frames along with the settings used and
+the results of segmenting them. Lets problems seen inside Talon be replayed
+and benchmarked offline with replay_corpus.py.
+
+A corpus is a directory containing:
+
+    frames.u8    The raw RGB pixels of every frame, one after another
+    index.jsonl  One JSON record per frame, giving its byte offset and shape
+                 along with the settings, rects and stage timings
+
+The frames file is memory-mapped when reading, so replaying a large corpus
+doesn't need it all in memory.
+"""
+
+from typing import Iterable, List, Tuple
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .config import calculate_mask_from_config
+from .projection import ProjectionIndex
+from .segment import LineGroup, calculate_grouped_rects
+from .types import Image, Rect
+
+
+FRAMES_FILENAME = "frames.u8"
+INDEX_FILENAME = "index.jsonl"
+
+
+class CorpusWriter:
+    """
+    Appends frames and their results to a corpus directory. Safe to use from
+    several threads. Frames are written by a background thread, so recording
+    doesn't hold up showing the labels.
+    """
+
+    def __init__(self, directory: str, max_pending: int=8):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Frames waiting for the writer thread. Bounded so a slow disk can't
+        # hold on to any number of full screen captures.
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def append(
+            self,
+            image: Image,
+            bounding_rect: Tuple[int, int, int, int],
+            settings: dict,
+            groups: List[LineGroup],
+            timings: dict):
+        """
+        Queues a frame to be recorded. bounding_rect is the (x, y, width,
+        height) screen rect it was captured from, settings are those needed
+        to reproduce the segmentation (see replay_record). The pixels are
+        copied, so the image can be changed afterwards. The frame is dropped
+        if too many are already waiting to be written.
+        """
+
+        record = {
+            "shape": list(image.data.shape),
+            "bounding_rect": [int(val) for val in bounding_rect],
+            "settings": settings,
+            "lines": groups_to_lists(groups),
+            "timings": timings,
+            "recorded_at": time.time(),
+        }
+        data = np.array(image.data, dtype=np.uint8, order="C")
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_pending, daemon=True)
+                self._thread.start()
+        try:
+            self._pending.put_nowait((data, record))
+        except queue.Full:
+            sys.stderr.write(f"telector corpus writer is behind, dropped a frame for {self.directory}\n")
+
+    def flush(self):
+        """
+        Waits for all the queued frames to be written
+        """
+
+        self._pending.join()
+
+    def close(self):
+        """
+        Writes any queued frames then stops the writer thread
+        """
+
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._pending.put(None)
+            thread.join()
+
+    def _write_pending(self):
+        while True:
+            pending = self._pending.get()
+            try:
+                if pending is None:
+                    return
+                self._write(*pending)
+            except OSError as e:
+                sys.stderr.write(f"telector couldn't record a frame to {self.directory}: {e}\n")
+            finally:
+                self._pending.task_done()
+
+    def _write(self, data: np.ndarray, record: dict):
+        with open(os.path.join(self.directory, FRAMES_FILENAME), "ab") as frames_file:
+            frames_file.seek(0, os.SEEK_END)
+            record["offset"] = frames_file.tell()
+            frames_file.write(memoryview(data))
+
+        # Only write the index record once its frame is fully written
+        with open(os.path.join(self.directory, INDEX_FILENAME), "a") as index_file:
+            index_file.write(json.dumps(record) + "\n")
+
+
+class CorpusReader:
+    """
+    Reads the frames and records of a corpus directory
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILENAME)) as index_file:
+            self.records = [json.loads(line) for line in index_file if line.strip()]
+
+        frames_path = os.path.join(directory, FRAMES_FILENAME)
+        self.frames = \
+            np.memmap(frames_path, dtype=np.uint8, mode="r") \
+            if os.path.getsize(frames_path) > 0 else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self) -> Iterable[Tuple[dict, Image]]:
+        for record in self.records:
+            yield record, self.image(record)
+
+    def image(self, record: dict) -> Image:
+        """
+        The frame for the given record, a read only view onto the memory map
+        """
+
+        shape = tuple(record["shape"])
+        size = int(np.prod(shape))
+        offset = record["offset"]
+        return Image(self.frames[offset:offset + size].reshape(shape))
+
+
+def groups_to_lists(groups: List[LineGroup]) -> List[dict]:
+    """
+    Converts segmentation results into JSON friendly lists of rects
+    """
+
+    return [
+        {
+            "line_rect": _rect_to_list(group.line_rect),
+            "word_rects": [_rect_to_list(rect) for rect in group.word_rects],
+        }
+        for group in groups
+    ]
+
+
+def replay_record(record: dict, image: Image) -> dict:
+    """
+    Re-runs masking and segmentation for a recorded frame, returning the new
+    results and timings alongside whether they match the recorded ones.
+    """
+
+    settings = record["settings"]
+    word_spacing = settings.get("word_spacing", -1)
+
+    start = time.perf_counter()
+    mask = calculate_mask_from_config(
+        image,
+        settings["mask_config"],
+        settings.get("selection_colors")
+    )
+    mask_done = time.perf_counter()
+    index = ProjectionIndex(mask)
+    index_done = time.perf_counter()
+    groups = calculate_grouped_rects(
+        index,
+        word_whitespace_threshold=None if word_spacing == -1 else word_spacing
+    )
+    lines = groups_to_lists(groups)
+    segment_done = time.perf_counter()
+
+    return {
+        "offset": record["offset"],
+        "matches": lines == record["lines"],
+        "recorded_lines": len(record["lines"]),
+        "replayed_lines": len(lines),
+        "recorded_timings": record["timings"],
+        "replayed_timings": {
+            "mask_ms": round((mask_done - start) * 1000, 3),
+            "index_ms": round((index_done - mask_done) * 1000, 3),
+            "segment_ms": round((segment_done - index_done) * 1000, 3),
+        },
+    }
+
+
+def main(argv: List[str]=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Replays a corpus recorded with user.telector_record_dir, comparing "
+            "the results and timings against those recorded."
+        )
+    )
+    parser.add_argument("directory", help="The corpus directory")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Only replay this many frames"
+    )
+    args = parser.parse_args(argv)
+
+    reader = CorpusReader(args.directory)
+    mismatches = 0
+    recorded_total = 0.0
+    replayed_total = 0.0
+    for i, (record, image) in enumerate(reader):
+        if args.limit is not None and i >= args.limit:
+            break
+
+        result = replay_record(record, image)
+        mismatches += 0 if result["matches"] else 1
+        recorded_total += sum(result["recorded_timings"].values())
+        replayed_total += sum(result["replayed_timings"].values())
+        sys.stdout.write(json.dumps(result) + "\n")
+
+    replayed = len(reader) if args.limit is None else min(args.limit, len(reader))
+    sys.stderr.write(
+        f"{replayed} frames replayed, {mismatches} mismatched. "
+        f"Recorded {recorded_total:.1f}ms total, replayed {replayed_total:.1f}ms total\n"
+    )
+    if mismatches > 0:
+        sys.exit(1)
+
+
+def _rect_to_list(rect: Rect) -> List[int]:
+    return [int(rect.x1), int(rect.y1), int(rect.x2), int(rect.y2)]
@@ -0,0 +1,188 @@
+"""
+Detection of the character cell grid used by fixed width text, e.g. in
+terminals and code editors. When text sits on a grid, whether a gap between
+characters is a space can be read straight off the grid rather than guessed
+from the widths of the gaps seen.
+"""
+
+from typing import List, Optional, Union
+
+import numpy as np
+
+from .projection import ProjectionIndex
+from .types import Mask, Rect
+
+
+# Bounds on the sizes of cell that are searched for, in pixels
+MIN_CELL_WIDTH = 4
+MAX_CELL_WIDTH = 64
+MIN_CELL_HEIGHT = 8
+MAX_CELL_HEIGHT = 128
+
+# How strongly periodic a projection must be to be treated as a grid. The
+# peak is the normalised autocorrelation at the period, and the prominence
+# is how far it rises above the lowest point at a shorter lag. Proportional
+# text gives a smooth decay with no peak at all.
+MIN_PEAK = 0.5
+MIN_PROMINENCE = 0.3
+
+# Height to width ratios of character cells which are plausible for a font
+MIN_CELL_ASPECT = 1.2
+MAX_CELL_ASPECT = 3.5
+
+
+class CellGrid:
+    """
+    The columns of a fixed width character grid. Cell i covers the columns
+    edges[i] to edges[i + 1], with the edges falling in the gaps between
+    characters. Partial cells at either side of the capture are included.
+    """
+
+    def __init__(self, cell_width: float, cell_height: Optional[int], origin: float, width: int):
+        self.cell_width = cell_width
+        # Only used to sanity check the grid, None if there weren't enough
+        # lines of text to measure it
+        self.cell_height = cell_height
+        # x position of the first full cell
+        self.origin = origin
+
+        count = int(np.ceil((width - origin) / cell_width))
+        edges = np.round(origin + np.arange(count + 1) * cell_width).astype(np.int64)
+        edges = np.clip(edges, 0, width)
+        self.edges = np.unique(np.concatenate(([0], edges, [width])))
+
+    def __len__(self):
+        return len(self.edges) - 1
+
+    def occupancy(self, mask: Union[Mask, ProjectionIndex], line_rects: List[Rect]) -> np.ndarray:
+        """
+        Which cells of each line contain foreground pixels, as a (lines,
+        cells) array. Only the middle half of each cell is counted. Fixed
+        width fonts centre even narrow glyphs like "." in their cell, while
+        anti-aliasing and wide glyphs can bleed into the edges of a
+        neighbouring space.
+        """
+
+        margin = int(round(self.cell_width / 4))
+        starts = np.minimum(self.edges[:-1] + margin, self.edges[1:])
+        ends = np.maximum(self.edges[1:] - margin, starts)
+        if len(line_rects) == 0:
+            return np.zeros((0, len(self)), dtype=bool)
+
+        if isinstance(mask, ProjectionIndex):
+            # Summed-area table lookups, so this is O(lines * cells)
+            ys1 = np.array([rect.y1 for rect in line_rects])[:, np.newaxis]
+            ys2 = np.array([rect.y2 for rect in line_rects])[:, np.newaxis]
+            table = mask.table
+            counts = (
+                table[ys2, ends] - table[ys1, ends] -
+                table[ys2, starts] + table[ys1, starts]
+            )
+        else:
+            height, width = mask.shape
+            cumulative = np.zeros((len(line_rects), width + 1), dtype=np.int64)
+            for i, rect in enumerate(line_rects):
+                np.cumsum(mask.col_counts(Rect(0, rect.y1, width, rect.y2)), out=cumulative[i, 1:])
+            counts = cumulative[:, ends] - cumulative[:, starts]
+
+        return counts > 0
+
+
+def estimate_cell_grid(mask: Union[Mask, ProjectionIndex]) -> Optional[CellGrid]:
+    """
+    Looks for a fixed width character grid in the mask using the
+    autocorrelation of its column and row projections. Returns None if the
+    text doesn't look like it's on a grid.
+    """
+
+    height, width = mask.shape
+    col_counts = np.asarray(mask.col_counts(), dtype=np.float64)
+    if not col_counts.any():
+        return None
+
+    # Differencing removes the slow variation from e.g. a mostly empty right
+    # hand side, which otherwise swamps the per cell variation
+    cell_width = find_period(np.diff(col_counts), MIN_CELL_WIDTH, MAX_CELL_WIDTH)
+    if cell_width is None:
+        return None
+
+    cell_height = find_period(
+        np.asarray(mask.row_counts(), dtype=np.float64),
+        MIN_CELL_HEIGHT,
+        MAX_CELL_HEIGHT
+    )
+    if cell_height is not None:
+        cell_height = int(round(cell_height))
+        if not MIN_CELL_ASPECT <= cell_height / cell_width <= MAX_CELL_ASPECT:
+            return None
+
+    # Fold all the columns onto a single cell, then put the cell edges in
+    # the middle of the emptiest part of it
+    phases = np.floor(np.arange(width) % cell_width).astype(np.int64)
+    folded = np.bincount(phases, weights=col_counts)
+    spread = max(int(cell_width) // 4, 1)
+    smoothed = sum(np.roll(folded, shift) for shift in range(-spread, spread + 1))
+    origin = float(np.argmin(smoothed))
+
+    return CellGrid(cell_width, cell_height, origin, width)
+
+
+def find_period(signal: np.ndarray, min_period: int, max_period: int) -> Optional[float]:
+    """
+    Finds the (possibly fractional) period of a projection, or None if it
+    isn't clearly periodic within the given bounds.
+    """
+
+    autocorrelation = _autocorrelation(signal)
+    max_period = min(max_period, len(signal) // 4)
+    if autocorrelation is None or max_period <= min_period:
+        return None
+
+    # The shortest lag which is a clear peak is the period. Longer lags will
+    # also peak at multiples of it.
+    period = None
+    lowest = np.min(autocorrelation[1:min_period])
+    for lag in range(min_period, max_period + 1):
+        value = autocorrelation[lag]
+        if (
+                value >= MIN_PEAK and
+                value - lowest >= MIN_PROMINENCE and
+                value >= autocorrelation[lag - 1] and
+                value >= autocorrelation[lag + 1]):
+            period = lag
+            break
+        lowest = min(lowest, value)
+
+    if period is None:
+        return None
+
+    # Scaled displays can give cells a fractional width, which an integer lag
+    # can't describe. The peaks at multiples of the period pin it down more
+    # precisely. Doubling the multiple each time keeps the next peak within
+    # half a cell of where the current estimate puts it.
+    estimate = float(period)
+    multiple = 1
+    reach = max(period // 3, 1)
+    while 2 * multiple * estimate + reach < len(signal) // 2:
+        multiple *= 2
+        centre = int(round(multiple * estimate))
+        start = centre - reach
+        estimate = (start + int(np.argmax(autocorrelation[start:centre + reach + 1]))) / multiple
+
+    return estimate
+
+
+def _autocorrelation(signal: np.ndarray) -> Optional[np.ndarray]:
+    """
+    The autocorrelation of the signal normalised so lag 0 is 1, calculated
+    with an FFT. None if the signal is constant.
+    """
+
+    centred = signal - signal.mean()
+    size = 1 << int(2 * len(centred) - 1).bit_length()
+    spectrum = np.fft.rfft(centred, size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(centred)]
+    if autocorrelation[0] <= 0:
+        return None
+
+    return autocorrelation / autocorrelation[0]
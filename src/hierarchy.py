@@ -0,0 +1,143 @@
+"""
+A flat, array based index of the lines, words and glyph clusters found by the
+segmentation functions.
+"""
+
+from typing import List
+
+import numpy as np
+
+from .segment import LineGroup
+from .types import Rect
+
+
+TARGET_MODES = ("lines", "words", "chars")
+
+
+class SegmentHierarchy:
+    """
+    Lines, words and glyph clusters from one segmentation pass. Each level is
+    an (n, 4) array of x1, y1, x2, y2 rows, linked to the level below by an
+    offset array. For example the words of line i are
+
+        word_rects[line_word_offsets[i]:line_word_offsets[i + 1]]
+
+    and the glyph clusters of word j are
+
+        glyph_rects[word_glyph_offsets[j]:word_glyph_offsets[j + 1]]
+    """
+
+    def __init__(self, groups: List[LineGroup]):
+        self.line_rects = _to_array(group.line_rect for group in groups)
+        self.word_rects = _to_array(
+            rect
+            for group in groups
+            for rect in group.word_rects
+        )
+        self.glyph_rects = _to_array(
+            rect
+            for group in groups
+            for word_glyph_rects in group.word_glyph_rects
+            for rect in word_glyph_rects
+        )
+        self.line_word_offsets = _to_offsets(
+            len(group.word_rects)
+            for group in groups
+        )
+        self.word_glyph_offsets = _to_offsets(
+            len(word_glyph_rects)
+            for group in groups
+            for word_glyph_rects in group.word_glyph_rects
+        )
+
+    def target_array(self, target_mode: str) -> np.ndarray:
+        """
+        All the rects for the given target mode (one of TARGET_MODES) in
+        reading order, as an (n, 4) array of x1, y1, x2, y2 rows
+        """
+
+        return self._level(target_mode)
+
+    def to_groups(self, dx: int=0, dy: int=0) -> List[LineGroup]:
+        """
+        Line groups already segmented into these words and glyph clusters,
+        with every rect moved by (dx, dy)
+        """
+
+        offset = np.array([dx, dy, dx, dy])
+        return groups_from_arrays(
+            self.line_rects + offset,
+            self.word_rects + offset,
+            self.glyph_rects + offset,
+            self.line_word_offsets,
+            self.word_glyph_offsets
+        )
+
+    def _level(self, target_mode: str):
+        if target_mode == "lines":
+            return self.line_rects
+        if target_mode == "chars":
+            return self.glyph_rects
+
+        return self.word_rects
+
+
+class ArrayLineGroup(LineGroup):
+    """
+    A LineGroup whose words and glyph clusters are already known, as arrays
+    of x1, y1, x2, y2 rows. The rects are only turned into Rect objects when
+    first accessed.
+    """
+
+    def __init__(self, line_rect: Rect, word_rects: np.ndarray, word_glyph_rects: List[np.ndarray]):
+        super().__init__(None, line_rect)
+        self._word_rect_array = word_rects
+        self._word_glyph_rect_arrays = word_glyph_rects
+
+    def _segment(self):
+        if self._word_rects is None:
+            self._word_rects = _to_rects(self._word_rect_array)
+            self._word_glyph_rects = [
+                _to_rects(glyph_rects)
+                for glyph_rects in self._word_glyph_rect_arrays
+            ]
+
+
+def groups_from_arrays(
+        line_rects: np.ndarray,
+        word_rects: np.ndarray,
+        glyph_rects: np.ndarray,
+        line_word_offsets: np.ndarray,
+        word_glyph_offsets: np.ndarray) -> List[LineGroup]:
+    """
+    ArrayLineGroups from the arrays of a SegmentHierarchy
+    """
+
+    groups = []
+    for i, line_rect in enumerate(line_rects.tolist()):
+        word_start, word_end = line_word_offsets[i], line_word_offsets[i + 1]
+        groups.append(ArrayLineGroup(
+            Rect(*line_rect),
+            word_rects[word_start:word_end],
+            [
+                glyph_rects[word_glyph_offsets[word]:word_glyph_offsets[word + 1]]
+                for word in range(word_start, word_end)
+            ]
+        ))
+
+    return groups
+
+
+def _to_array(rects) -> np.ndarray:
+    return np.array(
+        [(rect.x1, rect.y1, rect.x2, rect.y2) for rect in rects],
+        dtype=np.int64
+    ).reshape(-1, 4)
+
+
+def _to_offsets(counts) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(list(counts), dtype=np.int64)))
+
+
+def _to_rects(array: np.ndarray) -> List[Rect]:
+    return [Rect(*row) for row in array.tolist()]
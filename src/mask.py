@@ -3,12 +3,49 @@ Functions for converting an Image to a Mask. The Mask has False for
 background pixels and True for foreground pixels.
 """
 
-from typing import Tuple, List
+from typing import List, NamedTuple, Tuple
 
-import cv2
 import numpy as np
 
-from .types import Image, Mask
+from .types import Image, Mask, Rect
+
+
+class BackgroundPalette(NamedTuple):
+    """
+    The background found by a background detector, as colors which can be
+    used to mask any part of the same image on their own, e.g. a few rows of
+    it captured again. Pixels with any of the colors are background, as is
+    everything outside area.
+    """
+
+    # Packed as by _pack_colors
+    colors: np.ndarray
+    area: Rect
+
+    def mask(self, image: Image, y: int=0) -> Mask:
+        """
+        Masks image, which holds rows of the image the palette was found for
+        starting at row y
+        """
+
+        return self._mask_packed(_pack_colors(image.data), y)
+
+    def _mask_packed(self, packed: np.ndarray, y: int=0) -> Mask:
+        mask_array = np.ones(packed.shape, dtype=bool)
+        for color in self.colors:
+            mask_array &= packed != color
+
+        height, width = packed.shape
+        top = min(max(self.area.y1 - y, 0), height)
+        bottom = max(min(self.area.y2 - y, height), top)
+        left = min(max(self.area.x1, 0), width)
+        right = max(min(self.area.x2, width), left)
+        mask_array[:top] = False
+        mask_array[bottom:] = False
+        mask_array[:, :left] = False
+        mask_array[:, right:] = False
+
+        return Mask(mask_array)
 
 
 def calculate_floodfill_mask(
@@ -19,6 +56,25 @@ def calculate_floodfill_mask(
     Calculates a mask by floodfilling from the given pixel.
     """
 
+    return calculate_floodfill_mask_and_palette(image, start_point, selection_colors)[0]
+
+
+def calculate_floodfill_mask_and_palette(
+        image: Image,
+        start_point: Tuple[int, int],
+        selection_colors=None) -> Tuple[Mask, BackgroundPalette]:
+    """
+    Like calculate_floodfill_mask, but also gives the BackgroundPalette of
+    the flooded color, any selection colors and the area the flood reached.
+    The palette treats areas of the color enclosed by text, like the middle
+    of an "o", as background while the mask doesn't. That doesn't change
+    which rows and columns have foreground in them.
+    """
+
+    # OpenCV is slow to import and only needed here, so only import it on
+    # first use
+    import cv2
+
     # Take a copy because floodFill is going to destroy its input
     img = np.copy(image.data)
 
@@ -27,12 +83,19 @@ def calculate_floodfill_mask(
     height, width, _ = img.shape
     mask = np.zeros((height+2, width+2), np.uint8)
     cv2.floodFill(img, mask, (start_x, start_y), 1)
+    flooded_color = _pack_colors(image.data[start_y:start_y + 1, start_x:start_x + 1])[0, 0]
 
     # Floodfill uses the extra pixels to make a border. Get rid of that
     trimmed_mask = mask[1:-1, 1:-1]
 
-    # Take a note of the coords filled in by flood fill for bounding box usage later
-    filled_coords = np.asarray(np.where(trimmed_mask == 1)).T
+    # Take a note of the first and last coords (in row major order) filled in by
+    # flood fill for bounding box usage later. Avoid np.where here, listing every
+    # filled coordinate is by far the slowest step on large captures.
+    filled = trimmed_mask == 1
+    filled_rows = np.flatnonzero(filled.any(axis=1))
+    first_row, last_row = filled_rows[0], filled_rows[-1]
+    first_coord = (first_row, np.argmax(filled[first_row]))
+    last_coord = (last_row, width - 1 - np.argmax(filled[last_row][::-1]))
 
     # Turn any extra selection colors into background and their contained
     # contents into foreground.
@@ -47,13 +110,21 @@ def calculate_floodfill_mask(
 
     # Floodfill has found the extent of the textbox background. Mark all rows above and
     # below that as background also.
-    trimmed_mask[0:filled_coords[0][0]+1, :] = 1
-    trimmed_mask[filled_coords[-1][0]:, :] = 1
+    trimmed_mask[0:first_coord[0]+1, :] = 1
+    trimmed_mask[last_coord[0]:, :] = 1
     # And mark all rows to the left and right of the found background as background also.
-    trimmed_mask[:, 0:filled_coords[0][1]+1] = 1
-    trimmed_mask[:, filled_coords[-1][1]:] = 1
+    trimmed_mask[:, 0:first_coord[1]+1] = 1
+    trimmed_mask[:, last_coord[1]:] = 1
+
+    palette = BackgroundPalette(
+        np.array(
+            [flooded_color] + [_pack_hex(color) for color in selection_colors or []],
+            dtype=np.uint32
+        ),
+        Rect(int(first_coord[1]) + 1, int(first_coord[0]) + 1, int(last_coord[1]), int(last_coord[0]))
+    )
 
-    return Mask(trimmed_mask == 0)
+    return Mask(trimmed_mask == 0), palette
 
 
 def calculate_explicit_mask(
@@ -66,15 +137,97 @@ def calculate_explicit_mask(
     color. This is fixable, but would require a little bit of work.
     """
 
-    maskable_colors = background_colors + (selection_colors or [])
-    img = image.data
-    height, width, _ = img.shape
-    mask_array = np.ones((height, width), np.uint8) == 1
-    for color_str in maskable_colors:
-        color = _decode_hex(color_str)
-        mask_array = mask_array & (img != color).any(axis=2)
+    return explicit_palette(image, background_colors, selection_colors).mask(image)
+
+
+def explicit_palette(
+        image: Image,
+        background_colors: List[str],
+        selection_colors=None) -> BackgroundPalette:
+    """
+    The BackgroundPalette used by calculate_explicit_mask
+    """
+
+    height, width, _ = image.data.shape
+    return BackgroundPalette(
+        np.array(
+            [_pack_hex(color) for color in background_colors + (selection_colors or [])],
+            dtype=np.uint32
+        ),
+        Rect(0, 0, width, height)
+    )
+
+
+def calculate_dominant_color_mask(
+        image: Image,
+        min_coverage: float=0.1,
+        max_colors: int=4,
+        max_samples: int=65536,
+        selection_colors=None) -> Mask:
+    """
+    Calculates a mask by treating the most common colors as background. Any
+    color covering at least min_coverage of the image is background, up to
+    max_colors of them, and the single most common color always is. The
+    colors are counted on a grid of at most around max_samples pixels.
+    """
+
+    return calculate_dominant_color_mask_and_palette(
+        image,
+        min_coverage,
+        max_colors,
+        max_samples,
+        selection_colors
+    )[0]
+
+
+def calculate_dominant_color_mask_and_palette(
+        image: Image,
+        min_coverage: float=0.1,
+        max_colors: int=4,
+        max_samples: int=65536,
+        selection_colors=None) -> Tuple[Mask, BackgroundPalette]:
+    """
+    Like calculate_dominant_color_mask, but also gives the BackgroundPalette
+    of the background colors it found
+    """
+
+    packed = _pack_colors(image.data)
+    height, width = packed.shape
+
+    step = max(int(np.sqrt(height * width / max_samples)), 1)
+    colors, counts = np.unique(packed[::step, ::step], return_counts=True)
+    order = np.argsort(counts)[::-1][:max_colors]
+    coverage = counts[order] / counts.sum()
+    background_colors = colors[order[(coverage >= min_coverage) | (np.arange(len(order)) == 0)]]
+    if selection_colors is not None:
+        background_colors = np.concatenate((
+            background_colors,
+            np.array([_pack_hex(color) for color in selection_colors], dtype=np.uint32)
+        ))
+
+    palette = BackgroundPalette(background_colors, Rect(0, 0, width, height))
+    return palette._mask_packed(packed), palette
+
+
+def _pack_colors(data):
+    """
+    Packs the RGB channels of an image array into a single uint32 per pixel,
+    so colors can be compared and counted in one go.
+    """
+
+    packed = data[:, :, 0].astype(np.uint32) << 16
+    packed |= data[:, :, 1].astype(np.uint32) << 8
+    packed |= data[:, :, 2]
+    return packed
+
+
+def _pack_hex(hexstr):
+    """
+    Packs a RGB hex string like #aabbff the same way as _pack_colors
+    """
 
-    return Mask(mask_array)
+    red, green, blue = _decode_hex(hexstr)
+    return np.uint32((red << 16) | (green << 8) | blue)
 
 
 def _decode_hex(hexstr):
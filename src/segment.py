@@ -1,67 +1,209 @@
 """
-Functions for segmenting a Mask into lines and words.
+Functions for segmenting a Mask into lines and words. Anything providing
+row_counts and col_counts can be segmented, so these also accept a
+ProjectionIndex built from the Mask.
+
+Fixed width text is segmented using the character cells found by grid.py
+where possible, falling back to looking at the gaps between glyphs.
 """
 
-from typing import List
+from typing import List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 
+from .grid import CellGrid, estimate_cell_grid
+from .spacing import WordSpacing, estimate_word_spacing
+from .projection import ProjectionIndex
 from .types import Mask, Rect
 
 
-def calculate_line_rects(mask: Mask) -> List[Rect]:
+class LineGroup:
     """
-    Finds all the line bounding boxes in the Mask
+    A line rect along with the word rects contained within it, and the glyph
+    cluster rects within each word. These are only calculated the first time
+    they're accessed, so callers that only want lines don't pay for word
+    segmentation.
     """
-    img_mask = mask.data
 
-    # Find the first non-background pixel in each line
-    start_columns = np.argmax(img_mask, axis=1)
-    # And the last non-background pixel (counting from the right side)
-    end_columns_inverses = np.argmax(np.flip(img_mask, axis=1), axis=1)
+    def __init__(
+            self,
+            mask: Union[Mask, ProjectionIndex],
+            line_rect: Rect,
+            word_whitespace_threshold=None,
+            grid: Optional[CellGrid]=None,
+            cell_occupancy=None):
+        self.line_rect = line_rect
+        self._mask = mask
+        self._word_whitespace_threshold = word_whitespace_threshold
+        # The CellGrid of the capture and which of its cells are occupied in
+        # this line, if the text is fixed width
+        self._grid = grid
+        self._cell_occupancy = cell_occupancy
+        self._word_cells = None
+        self._word_rects = None
+        self._word_glyph_rects = None
 
-    start_y = -1
-    start_cols = []
-    end_cols = []
-    height, width = img_mask.shape
-    rtn = []
-    for y, start_col, end_col_inverse in zip(range(height), start_columns, end_columns_inverses):
-        if start_col == 0:
-            # We've hit some white space, emit a line box
-            if start_y > -1:
-                # Minimum line height.
-                # TODO: This could be done better by merging small gaps into the above
-                # line. This would deal with lines of ==== and _ in the Terminus font.
-                # (x1, y1), (x2, y2) of line bounding box
-                if y - start_y > 2:
-                    rtn.append(
-                        Rect(
-                            min(start_cols),
-                            start_y,
-                            max(end_cols),
-                            y
-                        )
-                    )
-                start_y = -1
-                start_cols = []
-                end_cols = []
-            else:
-                # Skip, we haven't found the first line yet
-                continue
-        else:
-            if start_y == -1:
-                start_y = max(y - 1, 0)
-
-            start_cols.append(start_col)
-            end_cols.append(
-                width - end_col_inverse - 1
+    @property
+    def word_rects(self) -> List[Rect]:
+        self._segment()
+        return self._word_rects
+
+    @property
+    def word_glyph_rects(self) -> List[List[Rect]]:
+        """
+        The glyph cluster rects within each of word_rects
+        """
+
+        self._segment()
+        if self._word_glyph_rects is None:
+            # Fixed width text, where each occupied cell is a glyph
+            self._word_glyph_rects = [
+                grid_cell_rects(self._grid, self.line_rect, [
+                    (cell, cell + 1)
+                    for cell in start + np.flatnonzero(self._cell_occupancy[start:end])
+                ])
+                for start, end in self._word_cells.tolist()
+            ]
+
+        return self._word_glyph_rects
+
+    @property
+    def glyph_rects(self) -> List[Rect]:
+        return [
+            glyph_rect
+            for glyph_rects in self.word_glyph_rects
+            for glyph_rect in glyph_rects
+        ]
+
+    def _segment(self):
+        if self._word_rects is None and self._grid is not None:
+            self._word_cells = find_grid_words(
+                self._cell_occupancy,
+                self._grid.cell_width,
+                word_whitespace_threshold=self._word_whitespace_threshold
             )
+            if self._word_cells is not None:
+                self._word_rects = grid_cell_rects(self._grid, self.line_rect, self._word_cells)
+
+        if self._word_rects is None:
+            self._word_rects, self._word_glyph_rects = calculate_word_glyph_rects(
+                self._mask,
+                self.line_rect,
+                word_whitespace_threshold=self._word_whitespace_threshold
+            )
+
+    def __repr__(self):
+        return f"LineGroup({self.line_rect})"
+
+
+class TextLayout(NamedTuple):
+    """
+    What calculate_grouped_rects works out from the whole of a Mask before
+    segmenting its lines. Passing it back in segments part of the same
+    capture, e.g. a few lines captured again, the same way as the rest.
+    """
+
+    # The character grid, if the text is fixed width
+    grid: Optional[CellGrid]
+    # Word spacing estimated from every line's gaps. None if the grid is
+    # used or there's an explicit word_whitespace_threshold.
+    spacing: Optional[WordSpacing]
+
+
+def estimate_text_layout(
+        mask: Union[Mask, ProjectionIndex],
+        word_whitespace_threshold=None,
+        detect_grid: bool=True,
+        line_rects: Optional[List[Rect]]=None) -> TextLayout:
+    """
+    Looks for a character grid (if detect_grid is set) and otherwise, without
+    an explicit word_whitespace_threshold, estimates the word spacing from
+    the gaps in all the lines (see estimate_word_spacing).
+    """
+
+    if line_rects is None:
+        line_rects = calculate_line_rects(mask)
+
+    grid = estimate_cell_grid(mask) if detect_grid and line_rects else None
+    spacing = None
+    if grid is None and word_whitespace_threshold is None:
+        spacing = estimate_word_spacing(mask, line_rects)
+
+    return TextLayout(grid, spacing)
+
+
+def calculate_grouped_rects(
+        mask: Union[Mask, ProjectionIndex],
+        word_whitespace_threshold=None,
+        detect_grid: bool=True,
+        layout: Optional[TextLayout]=None) -> List[LineGroup]:
+    """
+    Finds all the lines in the Mask, each with (lazily calculated) word
+    rectangles. If detect_grid is set and the text is fixed width then words
+    are found using its character cells. Otherwise, without an explicit
+    word_whitespace_threshold, one is estimated from the gaps in all the
+    lines. A layout from estimate_text_layout is used instead of looking at
+    the whole Mask if given.
+    """
+
+    line_rects = calculate_line_rects(mask)
+    if layout is None:
+        layout = estimate_text_layout(mask, word_whitespace_threshold, detect_grid, line_rects)
+
+    grid = layout.grid
+    if grid is None:
+        if word_whitespace_threshold is not None or layout.spacing is None:
+            return [
+                LineGroup(mask, line_rect, word_whitespace_threshold)
+                for line_rect in line_rects
+            ]
+
+        # One spacing estimate from every line's gaps, rather than each line
+        # guessing from its own
+        return [
+            LineGroup(mask, line_rect, layout.spacing.threshold(line_rect.y2 - line_rect.y1))
+            for line_rect in line_rects
+        ]
+
+    # One lookup for every cell of every line
+    occupancy = grid.occupancy(mask, line_rects)
+    return [
+        LineGroup(mask, line_rect, word_whitespace_threshold, grid, cell_occupancy)
+        for line_rect, cell_occupancy in zip(line_rects, occupancy)
+    ]
+
+
+def calculate_line_rects(mask: Union[Mask, ProjectionIndex]) -> List[Rect]:
+    """
+    Finds all the line bounding boxes in the Mask
+    """
+
+    height, width = mask.shape
+    rtn = []
+    for start_y, end_y in find_runs(mask.row_counts() > 0):
+        # Include the row of whitespace above the line
+        start_y = max(start_y - 1, 0)
+
+        # Minimum line height.
+        # TODO: This could be done better by merging small gaps into the above
+        # line. This would deal with lines of ==== and _ in the Terminus font.
+        if end_y - start_y <= 2:
+            continue
+
+        # (x1, y1), (x2, y2) of line bounding box
+        cols = np.flatnonzero(mask.col_counts(Rect(0, start_y, width, end_y)))
+        rtn.append(Rect(
+            int(cols[0]),
+            start_y,
+            int(cols[-1]),
+            end_y
+        ))
 
     return rtn
 
 
 def calculate_word_rects(
-        mask: Mask,
+        mask: Union[Mask, ProjectionIndex],
         line_rect: Rect,
         word_whitespace_threshold=None) -> List[Rect]:
     """
@@ -69,79 +211,135 @@ def calculate_word_rects(
     line.
     """
 
-    line_slice = mask.data[
-        line_rect.y1:line_rect.y2,
-        line_rect.x1:line_rect.x2
-    ]
-    line_height = line_slice.shape[0]
+    return calculate_word_glyph_rects(mask, line_rect, word_whitespace_threshold)[0]
+
+
+def calculate_word_glyph_rects(
+        mask: Union[Mask, ProjectionIndex],
+        line_rect: Rect,
+        word_whitespace_threshold=None) -> Tuple[List[Rect], List[List[Rect]]]:
+    """
+    Finds all the word bounding boxes in the Mask contained within the given
+    line. Also returns the glyph clusters (runs of non-empty columns, usually
+    one or a few characters) making up each word.
+    """
 
     # Start by converting the line into a list of segments (blobs) describing
     # the start and end index of a set of columns which contain no white space.
-    # Also take a note of the distribution of whitespace widths we see
-
-    col_histograms = line_slice.sum(axis=0)
-
-    start_word_x = 0
-    end_word_x = 0
-    state = 'word'
-    blobs = []
-    whitespace_widths = []
-    for curr_x, val in enumerate(col_histograms):
-        is_empty_col = val == 0
-
-        if is_empty_col and state == 'word':
-            state = 'whitespace'
-            end_word_x = curr_x - 1
-        elif not is_empty_col and state == 'whitespace':
-            blobs.append((
-                start_word_x,
-                end_word_x,
-            ))
-            start_word_x = curr_x
-            whitespace_widths.append(start_word_x - end_word_x)
-
-            state = 'word'
-
-    # And add the final blob
-    blobs.append((start_word_x, line_slice.shape[1]))
-
-    # If we havent' got an explicit word_whitespace_threshold then guess one based
-    # on the distribution of whitespace widths we saw.
+    col_histograms = mask.col_counts(line_rect)
+    blobs, _ = find_blobs(col_histograms)
+
+    # Without an explicit word_whitespace_threshold this line is all there is
+    # to go on. calculate_grouped_rects passes one estimated from every line.
     if word_whitespace_threshold is None:
-        if len(whitespace_widths) < 2:
-            # Just take a wild guess for the threshold for lines without many
-            # blobs whitespace
-            word_whitespace_threshold = line_height // 7
-        else:
-            # Half the largest whitespace block seems to work OK as a threshold
-            biggest = min(max(*whitespace_widths), line_height)
-            word_whitespace_threshold = max(biggest // 2, 4)
+        word_whitespace_threshold = estimate_word_spacing(mask, [line_rect]).threshold(
+            line_rect.y2 - line_rect.y1
+        )
+
+    def _to_rect(start, end):
+        return Rect(
+            line_rect.x1 + start,
+            line_rect.y1,
+            line_rect.x1 + end,
+            line_rect.y2
+        )
 
     # Now join together the blobs which are less than the whitespace threshold
     # into words
-    rtn = []
-    accumulating_blob = None
-    for blob in blobs:
-        if accumulating_blob is None:
-            accumulating_blob = blob
-        else:
-            whitespace_width = (blob[0] - accumulating_blob[1])
-            if (whitespace_width < word_whitespace_threshold):
-                accumulating_blob = (accumulating_blob[0], blob[1])
-            else:
-                rtn.append(Rect(
-                    line_rect.x1 + accumulating_blob[0],
-                    line_rect.y1,
-                    line_rect.x1 + accumulating_blob[1],
-                    line_rect.y2
-                ))
-                accumulating_blob = blob
-
-    rtn.append(Rect(
-        line_rect.x1 + accumulating_blob[0],
-        line_rect.y1,
-        line_rect.x1 + accumulating_blob[1],
-        line_rect.y2
-    ))
+    word_rects = []
+    word_glyph_rects = []
+    accumulating_blobs = [blobs[0]]
+    for blob in blobs[1:]:
+        whitespace_width = (blob[0] - accumulating_blobs[-1][1])
+        if whitespace_width >= word_whitespace_threshold:
+            word_rects.append(_to_rect(accumulating_blobs[0][0], accumulating_blobs[-1][1]))
+            word_glyph_rects.append([_to_rect(*glyph) for glyph in accumulating_blobs])
+            accumulating_blobs = []
+        accumulating_blobs.append(blob)
 
-    return rtn
+    word_rects.append(_to_rect(accumulating_blobs[0][0], accumulating_blobs[-1][1]))
+    word_glyph_rects.append([_to_rect(*glyph) for glyph in accumulating_blobs])
+
+    return word_rects, word_glyph_rects
+
+
+def find_grid_words(cell_occupancy, cell_width: float, word_whitespace_threshold=None):
+    """
+    Finds the words of a line of fixed width text from which of its cells are
+    occupied (see CellGrid.occupancy). An empty cell is a space so separates
+    words, unless word_whitespace_threshold says that's too narrow. Returns
+    an (n, 2) array of the start and (exclusive) end cell of each word, or
+    None if no cells are occupied, e.g. if the line only contains box drawing
+    lines between cells.
+    """
+
+    padded = np.concatenate(([0], np.asarray(cell_occupancy, dtype=np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+    if len(edges) == 0:
+        return None
+
+    starts = edges[0::2]
+    ends = edges[1::2]
+    if word_whitespace_threshold is not None:
+        breaks = (starts[1:] - ends[:-1]) * cell_width >= word_whitespace_threshold
+        starts = starts[np.concatenate(([True], breaks))]
+        ends = ends[np.concatenate((breaks, [True]))]
+
+    return np.stack((starts, ends), axis=1)
+
+
+def grid_cell_rects(grid: CellGrid, line_rect: Rect, cell_spans) -> List[Rect]:
+    """
+    Turns (start, end) cell spans within a line into rects, clipped to the
+    line.
+    """
+
+    cell_spans = np.asarray(cell_spans).reshape(-1, 2)
+    x1s = np.maximum(grid.edges[cell_spans[:, 0]], line_rect.x1)
+    x2s = np.minimum(grid.edges[cell_spans[:, 1]], line_rect.x2)
+
+    return [
+        Rect(x1, line_rect.y1, x2, line_rect.y2)
+        for x1, x2 in zip(x1s.tolist(), x2s.tolist())
+    ]
+
+
+def find_runs(flags) -> List[Tuple[int, int]]:
+    """
+    Finds the runs of consecutive True values in the given 1D array. Returns
+    a list of (start, end) index pairs, with end being exclusive.
+    """
+
+    padded = np.concatenate(([0], np.asarray(flags, dtype=np.int8), [0]))
+    edges = np.flatnonzero(np.diff(padded))
+
+    return [
+        (int(start), int(end))
+        for start, end in zip(edges[0::2], edges[1::2])
+    ]
+
+
+def find_blobs(col_histogram) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """
+    Splits a line's column histogram into blobs of consecutive non-empty
+    columns. Returns the (start, end) column of each blob along with the width
+    of the whitespace between each consecutive pair of blobs.
+
+    The final blob always extends to the end of the histogram.
+    """
+
+    runs = find_runs(np.asarray(col_histogram) > 0)
+    if len(runs) == 0:
+        return [(0, len(col_histogram))], []
+
+    blobs = [
+        (start, end - 1)
+        for start, end in runs[:-1]
+    ]
+    blobs.append((runs[-1][0], len(col_histogram)))
+    whitespace_widths = [
+        next_blob[0] - blob[1]
+        for blob, next_blob in zip(blobs, blobs[1:])
+    ]
+
+    return blobs, whitespace_widths
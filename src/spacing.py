@@ -0,0 +1,189 @@
+"""
+Estimation of how wide a gap between glyphs has to be to separate words,
+from the gaps seen across a whole capture. Fitting it once per capture gives
+every line the same answer, including short lines with too few gaps of their
+own to go on.
+"""
+
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from .projection import ProjectionIndex
+from .types import Mask, Rect
+
+
+# Lines whose heights are within this ratio of each other share a bucket, so
+# e.g. headings get a wider threshold than body text
+HEIGHT_BUCKET_RATIO = 1.25
+# Fewest gaps a bucket needs for its own split, otherwise it borrows the
+# split of the nearest bucket which has one
+MIN_BUCKET_GAPS = 16
+# Spread, in log width, of each gap's contribution to the smoothed
+# distribution of gap widths
+DENSITY_SPREAD = 0.08
+# Extra spread for narrow gaps, divided by their width, since a pixel either
+# way is a large relative difference for them. Stops gaps which have been
+# rounded to every other width, e.g. by scaling, looking like separate
+# clusters.
+ROUNDING_SPREAD = 0.8
+# Step, in log width, of the smoothed distribution
+DENSITY_STEP = 0.02
+# Each cluster must have at least this fraction of the gaps
+MIN_CLUSTER_FRACTION = 0.05
+# The valley between the clusters must be at most this fraction of the
+# lower of their peaks
+MAX_VALLEY_DEPTH = 0.5
+# Narrowest threshold ever used. Gaps are measured as in find_blobs, so
+# this is 2 empty columns.
+MIN_THRESHOLD = 3
+
+
+class WordSpacing:
+    """
+    Word whitespace thresholds for each bucket of line heights, as fitted by
+    estimate_word_spacing. Each bucket's threshold is stored relative to its
+    typical line height so it can be scaled to the lines it's used for.
+    """
+
+    def __init__(self, ratios: Dict[int, float]):
+        # Bucket number to threshold divided by line height
+        self.ratios = ratios
+
+    def threshold(self, line_height: int) -> int:
+        """
+        The word whitespace threshold for a line of the given height
+        """
+
+        if len(self.ratios) == 0:
+            # Nothing to go on at all, so fall back on a typical proportion
+            return max(line_height // 7, MIN_THRESHOLD)
+
+        bucket = _height_bucket(line_height)
+        nearest = min(self.ratios, key=lambda other: (abs(other - bucket), other))
+        return max(int(round(self.ratios[nearest] * line_height)), MIN_THRESHOLD)
+
+
+def estimate_word_spacing(mask: Union[Mask, ProjectionIndex], line_rects: List[Rect]) -> WordSpacing:
+    """
+    Collects the gaps between glyph clusters in all the lines at once, then
+    splits those from lines of each height into gaps within words and gaps
+    between words.
+    """
+
+    gaps, gap_lines = find_line_gaps(mask, line_rects)
+    heights = np.array([rect.y2 - rect.y1 for rect in line_rects], dtype=np.int64)
+    gap_heights = heights[gap_lines]
+    buckets = _height_bucket(gap_heights)
+
+    ratios = {}
+    for bucket in np.unique(buckets).tolist():
+        in_bucket = buckets == bucket
+        if np.count_nonzero(in_bucket) < MIN_BUCKET_GAPS:
+            continue
+
+        # Gaps wider than the line height are column gaps or indents rather
+        # than spaces, so all count as the same width
+        height = int(np.median(gap_heights[in_bucket]))
+        threshold = split_gaps(np.minimum(gaps[in_bucket], height))
+        if threshold is not None:
+            ratios[bucket] = threshold / height
+
+    return WordSpacing(ratios)
+
+
+def find_line_gaps(mask: Union[Mask, ProjectionIndex], line_rects: List[Rect]):
+    """
+    The widths of the gaps between consecutive glyph clusters (runs of
+    non-empty columns) in every line, measured as in find_blobs, along with
+    the index of the line each is in. Done as a single pass over a (lines,
+    columns) array of column counts.
+    """
+
+    height, width = mask.shape
+    if len(line_rects) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    x1s = np.array([rect.x1 for rect in line_rects])[:, np.newaxis]
+    x2s = np.array([rect.x2 for rect in line_rects])[:, np.newaxis]
+    if isinstance(mask, ProjectionIndex):
+        ys1 = np.array([rect.y1 for rect in line_rects])
+        ys2 = np.array([rect.y2 for rect in line_rects])
+        # Summed-area table rows, so this is O(lines * columns)
+        cumulative = mask.table[ys2] - mask.table[ys1]
+        counts = np.diff(cumulative, axis=1)
+    else:
+        counts = np.stack([
+            mask.col_counts(Rect(0, rect.y1, width, rect.y2))
+            for rect in line_rects
+        ])
+
+    # Only the columns within each line, as col_counts(line_rect) would give
+    columns = np.arange(width)[np.newaxis, :]
+    occupied = (counts > 0) & (columns >= x1s) & (columns < x2s)
+
+    padded = np.zeros((len(line_rects), width + 2), dtype=np.int8)
+    padded[:, 1:-1] = occupied
+    edges = np.diff(padded, axis=1)
+    start_lines, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+
+    # A gap runs from the end of each run to the start of the next one in
+    # the same line. find_blobs counts the last column of the run too.
+    same_line = start_lines[1:] == start_lines[:-1]
+    gaps = starts[1:][same_line] - ends[:-1][same_line] + 1
+
+    return gaps, start_lines[1:][same_line]
+
+
+def split_gaps(gaps: np.ndarray) -> Optional[int]:
+    """
+    Splits gap widths into two clusters at the deepest valley between two
+    peaks of their smoothed distribution. This is done on the log of the
+    widths, as it's their ratio which matters, and unlike splitting by
+    variance it doesn't mind one cluster being far larger than the other.
+    Returns the narrowest width in the upper cluster, or None if the gaps
+    don't clearly form two clusters.
+    """
+
+    if len(gaps) < 2:
+        return None
+
+    widths, counts = np.unique(gaps, return_counts=True)
+    log_widths = np.log(widths)
+    spreads = np.hypot(DENSITY_SPREAD, ROUNDING_SPREAD / widths)
+    # Gaps are always at least 2 wide
+    grid = np.arange(np.log(2), log_widths[-1] + DENSITY_STEP, DENSITY_STEP)
+    density = (
+        counts / spreads *
+        np.exp(-0.5 * ((grid[:, np.newaxis] - log_widths) / spreads) ** 2)
+    ).sum(axis=1)
+
+    rising = np.concatenate(([True], density[1:] >= density[:-1]))
+    falling = np.concatenate((density[:-1] > density[1:], [True]))
+    peaks = np.flatnonzero(rising & falling).tolist()
+
+    total = len(gaps)
+    best = None
+    best_score = 0
+    for i, first in enumerate(peaks):
+        for second in peaks[i + 1:]:
+            valley = first + int(np.argmin(density[first:second + 1]))
+            depth = density[valley] / min(density[first], density[second])
+            threshold = int(np.ceil(np.exp(grid[valley])))
+            below = int(counts[widths < threshold].sum())
+            smaller = min(below, total - below)
+            if depth > MAX_VALLEY_DEPTH or smaller < total * MIN_CLUSTER_FRACTION:
+                continue
+
+            # Prefer deep valleys between well populated clusters
+            score = (1 - depth) * smaller
+            if score > best_score:
+                best = threshold
+                best_score = score
+
+    return best
+
+
+def _height_bucket(heights):
+    return np.round(np.log(heights) / np.log(HEIGHT_BUCKET_RATIO)).astype(np.int64)
@@ -0,0 +1,139 @@
+"""
+Point lookups against segmented words, e.g. for finding the word under the
+mouse without showing any labels.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from .hierarchy import SegmentHierarchy
+
+
+class WordIndex:
+    """
+    A line sorted interval index over the words of a SegmentHierarchy. Lines
+    are found by binary search on their top edges, then words within the line
+    by binary search on their left edges, so lookups are O(log n).
+
+    Word numbers returned are indexes into hierarchy.word_rects, which is in
+    reading order.
+    """
+
+    def __init__(self, hierarchy: SegmentHierarchy):
+        self.hierarchy = hierarchy
+        self.line_y1s = hierarchy.line_rects[:, 1]
+        self.line_y2s = hierarchy.line_rects[:, 3]
+        self.word_x1s = hierarchy.word_rects[:, 0]
+        self.word_x2s = hierarchy.word_rects[:, 2]
+        self.line_word_offsets = hierarchy.line_word_offsets
+
+    def __len__(self):
+        return len(self.word_x1s)
+
+    def line_at(self, x: float, y: float) -> Optional[int]:
+        """
+        The number of the line containing the given point vertically, or None
+        """
+
+        line = int(np.searchsorted(self.line_y1s, y, side="right")) - 1
+        if line < 0 or y >= self.line_y2s[line]:
+            return None
+
+        return line
+
+    def word_at(self, x: float, y: float) -> Optional[int]:
+        """
+        The number of the word containing the given point, or None
+        """
+
+        line = self.line_at(x, y)
+        if line is None:
+            return None
+
+        word = self._word_in_line(line, x)
+        if word is None or not self.word_x1s[word] <= x <= self.word_x2s[word]:
+            return None
+
+        return word
+
+    def nearest_word(self, x: float, y: float) -> Optional[int]:
+        """
+        The number of the word closest to the given point, first preferring
+        the closest line and then the closest word within that line. None if
+        there are no words.
+        """
+
+        if len(self.line_y1s) == 0:
+            return None
+
+        line = self.line_at(x, y)
+        if line is None:
+            # Between lines or off the ends, pick the closer of the neighbours
+            below = int(np.searchsorted(self.line_y1s, y, side="right"))
+            candidates = [
+                candidate
+                for candidate in (below - 1, below)
+                if 0 <= candidate < len(self.line_y1s)
+            ]
+            line = min(
+                candidates,
+                key=lambda candidate: _distance(
+                    y,
+                    self.line_y1s[candidate],
+                    self.line_y2s[candidate]
+                )
+            )
+
+        return self._word_in_line(line, x)
+
+    def _word_in_line(self, line: int, x: float) -> Optional[int]:
+        """
+        The word in the given line closest to the given x position
+        """
+
+        start = self.line_word_offsets[line]
+        end = self.line_word_offsets[line + 1]
+        if start == end:
+            return None
+
+        word = start + int(np.searchsorted(self.word_x1s[start:end], x, side="right")) - 1
+        candidates = [
+            candidate
+            for candidate in (word, word + 1)
+            if start <= candidate < end
+        ]
+        return min(
+            candidates,
+            key=lambda candidate: _distance(
+                x,
+                self.word_x1s[candidate],
+                self.word_x2s[candidate]
+            )
+        )
+
+
+def proximity_ranks(rects: np.ndarray, x: float, y: float) -> np.ndarray:
+    """
+    The rank of each rect in an (n, 4) array of x1, y1, x2, y2 rows by
+    distance from the given point, 0 being the nearest. Rects the point is
+    inside are at distance 0. Ties keep the order of the array, so results
+    are the same for the same rects and point.
+    """
+
+    dx = np.maximum(np.maximum(rects[:, 0] - x, x - rects[:, 2]), 0)
+    dy = np.maximum(np.maximum(rects[:, 1] - y, y - rects[:, 3]), 0)
+    order = np.argsort(np.hypot(dx, dy), kind="stable")
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order))
+
+    return ranks
+
+
+def _distance(pos: float, start: float, end: float) -> float:
+    if pos < start:
+        return start - pos
+    if pos > end:
+        return pos - end
+
+    return 0
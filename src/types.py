@@ -14,7 +14,7 @@ class Image:  # pylint:disable=too-few-public-methods
         self.data = data
 
 
-class Mask:  # pylint:disable=too-few-public-methods
+class Mask:
     """
     A bitmap image. Contains a numpy array with shape (height, width) and each
     element is True or False. The convention is that True is a foreground
@@ -24,6 +24,32 @@ class Mask:  # pylint:disable=too-few-public-methods
     def __init__(self, data):
         self.data = data
 
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def row_counts(self, rect: 'Rect'=None):
+        """
+        Number of foreground pixels in each row of the given rect (or the whole
+        mask if not given).
+        """
+
+        return self._region(rect).sum(axis=1)
+
+    def col_counts(self, rect: 'Rect'=None):
+        """
+        Number of foreground pixels in each column of the given rect (or the
+        whole mask if not given).
+        """
+
+        return self._region(rect).sum(axis=0)
+
+    def _region(self, rect: 'Rect'=None):
+        if rect is None:
+            return self.data
+
+        return self.data[rect.y1:rect.y2, rect.x1:rect.x2]
+
 
 class Rect:  # pylint:disable=too-few-public-methods
     """
@@ -0,0 +1,525 @@
+"""
+An optional segmentation engine running in a separate, long lived Python
+process, so masking and segmenting large captures doesn't compete with Talon
+for the GIL.
+
+Frames are passed to the worker through a multiprocessing.shared_memory block
+rather than being pickled, and the worker writes the resulting rects back
+into the same block as flat int32 arrays. Only small JSON control messages go
+over the worker's stdin and stdout.
+
+The worker is run as `python -m src.worker` from the package directory, using
+a Python interpreter with numpy (and OpenCV for flood filling) installed.
+Talon's own executable can't be used for this, so SegmentationWorker is
+given the interpreter to use.
+"""
+
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional, Tuple
+
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .config import calculate_mask_and_palette_from_config
+from .grid import CellGrid
+from .hierarchy import SegmentHierarchy, groups_from_arrays
+from .mask import BackgroundPalette
+from .projection import ProjectionIndex
+from .segment import LineGroup, TextLayout, calculate_grouped_rects, estimate_text_layout
+from .spacing import WordSpacing
+from .types import Image, Rect
+
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Space after the frame in the shared block for the results. Enough for a
+# quarter of a million rects, far more than can ever be labelled.
+RESULT_CAPACITY = 4 * 1024 * 1024
+# Offset of the results in the shared block is aligned to this
+RESULT_ALIGNMENT = 64
+
+
+class WorkerError(Exception):
+    """
+    The worker process failed, timed out or couldn't be started
+    """
+
+
+class WorkerResult(NamedTuple):
+    """
+    A frame segmented by the worker
+    """
+
+    groups: List[LineGroup]
+    # What's needed to segment some of the lines again later without the
+    # whole frame, see _refresh_lines in talon_interface.py
+    palette: BackgroundPalette
+    layout: TextLayout
+
+
+class SegmentationWorker:
+    """
+    The parent side of the worker process. Starts it on first use, restarts
+    it if it dies or stops responding, and gives up (so the caller should
+    segment in process) after max_restarts failures in a row.
+
+    Requests are handled one at a time, so it's safe to use from several
+    threads.
+    """
+
+    def __init__(
+            self,
+            python: str,
+            start_timeout: float=10.0,
+            request_timeout: float=5.0,
+            ping_timeout: float=1.0,
+            max_restarts: int=3):
+        """
+        Args:
+            python: The Python interpreter to run the worker with.
+            start_timeout: How long the worker has to import everything and
+              report that it's ready.
+            request_timeout: How long a single frame can take before the
+              worker is considered stuck and restarted.
+            ping_timeout: How long a health check can take.
+            max_restarts: Consecutive failures before giving up on the worker.
+        """
+
+        self.python = python
+        self.start_timeout = start_timeout
+        self.request_timeout = request_timeout
+        self.ping_timeout = ping_timeout
+        self.max_restarts = max_restarts
+        self.failures = 0
+        self._process = None
+        self._responses = None
+        self._block = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """
+        False once the worker has failed too many times in a row to be worth
+        trying again
+        """
+
+        return self.failures < self.max_restarts
+
+    def segment(
+            self,
+            image: Image,
+            mask_config: str,
+            word_whitespace_threshold=None,
+            selection_colors: Optional[List[str]]=None) -> Optional[WorkerResult]:
+        """
+        Masks and segments the image in the worker, returning fully segmented
+        line groups along with the background palette and text layout used.
+        Returns None if the worker isn't available or fails, in which case
+        the caller should segment in process instead.
+        """
+
+        with self._lock:
+            if not self.available:
+                return None
+
+            try:
+                # Restart a worker that has died or stopped answering since
+                # the last frame, rather than waiting out request_timeout
+                if self._process is not None and not self._healthy():
+                    self._stop()
+                self._ensure_running()
+                response, result = self._segment(
+                    image,
+                    mask_config,
+                    word_whitespace_threshold,
+                    selection_colors
+                )
+            except WorkerError as e:
+                sys.stderr.write(f"telector segmentation worker failed: {e}\n")
+                self.failures += 1
+                self._stop()
+                return None
+
+            # The worker itself is fine even if the frame couldn't be
+            # segmented, e.g. because of a bad setting
+            self.failures = 0
+            if result is None:
+                sys.stderr.write(f"telector segmentation worker error: {response.get('error')}\n")
+
+            return result
+
+    def close(self):
+        with self._lock:
+            self._stop()
+            if self._block is not None:
+                self._block.close()
+                self._block.unlink()
+                self._block = None
+
+    def _healthy(self) -> bool:
+        """
+        Whether the worker is running and answers a ping in time
+        """
+
+        if self._process is None or self._process.poll() is not None:
+            return False
+
+        try:
+            self._request({"ping": True}, self.ping_timeout)
+        except WorkerError:
+            return False
+
+        return True
+
+    def _ensure_running(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+
+        self._stop()
+        try:
+            self._process = subprocess.Popen(
+                [self.python, "-m", "src.worker"],
+                cwd=PACKAGE_DIR,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1
+            )
+        except OSError as e:
+            self._process = None
+            raise WorkerError(f"couldn't start {self.python}: {e}")
+
+        # Read responses on a thread so waiting for them can time out on
+        # every platform
+        self._responses = queue.Queue()
+        threading.Thread(
+            target=_read_responses,
+            args=(self._process.stdout, self._responses),
+            daemon=True
+        ).start()
+
+        ready = self._receive(self.start_timeout)
+        if not ready.get("ready"):
+            raise WorkerError(f"unexpected startup message {ready}")
+        self._request({"ping": True}, self.ping_timeout)
+
+    def _stop(self):
+        if self._process is None:
+            return
+
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(0.5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        self._process = None
+        self._responses = None
+
+    def _segment(
+            self,
+            image: Image,
+            mask_config: str,
+            word_whitespace_threshold,
+            selection_colors: Optional[List[str]]) -> Tuple[dict, Optional[WorkerResult]]:
+        data = image.data
+        result_offset = _align(data.nbytes)
+        block = self._ensure_block(result_offset + RESULT_CAPACITY)
+        np.copyto(np.ndarray(data.shape, dtype=np.uint8, buffer=block.buf), data)
+
+        response = self._request(
+            {
+                "shm": block.name,
+                "shape": list(data.shape),
+                "mask_config": mask_config,
+                "word_whitespace_threshold": word_whitespace_threshold,
+                "selection_colors": selection_colors,
+                "result_offset": result_offset,
+                "result_capacity": RESULT_CAPACITY,
+            },
+            self.request_timeout
+        )
+        if not response.get("ok"):
+            return response, None
+
+        try:
+            return response, WorkerResult(
+                decode_groups(block.buf, result_offset, *response["counts"]),
+                BackgroundPalette(
+                    np.array(response["palette"]["colors"], dtype=np.uint32),
+                    Rect(*response["palette"]["area"])
+                ),
+                decode_layout(response["layout"])
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise WorkerError(f"couldn't read results: {e}")
+
+    def _ensure_block(self, size: int) -> shared_memory.SharedMemory:
+        if self._block is None or self._block.size < size:
+            if self._block is not None:
+                self._block.close()
+                self._block.unlink()
+                self._block = None
+            try:
+                self._block = shared_memory.SharedMemory(create=True, size=size)
+            except OSError as e:
+                # e.g. /dev/shm is full
+                raise WorkerError(f"couldn't allocate {size} bytes of shared memory: {e}")
+
+        return self._block
+
+    def _request(self, message: dict, timeout: float) -> dict:
+        self._next_id += 1
+        message = {**message, "id": self._next_id}
+        try:
+            self._process.stdin.write(json.dumps(message) + "\n")
+            self._process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise WorkerError(f"couldn't send request: {e}")
+
+        # Skip any late responses to requests that previously timed out
+        while True:
+            response = self._receive(timeout)
+            if response.get("id") == message["id"]:
+                return response
+
+    def _receive(self, timeout: float) -> dict:
+        try:
+            response = self._responses.get(timeout=timeout)
+        except queue.Empty:
+            raise WorkerError(f"no response within {timeout}s")
+        if response is None:
+            raise WorkerError("worker exited")
+
+        return response
+
+
+def _read_responses(stdout, responses: queue.Queue):
+    for line in stdout:
+        try:
+            responses.put(json.loads(line))
+        except ValueError:
+            # Not one of our messages, e.g. something printed by a library
+            continue
+    responses.put(None)
+
+
+def _align(offset: int) -> int:
+    return (offset + RESULT_ALIGNMENT - 1) // RESULT_ALIGNMENT * RESULT_ALIGNMENT
+
+
+def encode_groups(buffer, offset: int, capacity: int, groups: List[LineGroup]) -> Tuple[int, int, int]:
+    """
+    Writes the lines, words and glyph clusters of fully segmented groups into
+    the buffer as int32 arrays. Returns the (lines, words, glyphs) counts
+    needed to decode them.
+    """
+
+    hierarchy = SegmentHierarchy(groups)
+    arrays = _result_arrays(
+        buffer,
+        offset,
+        len(hierarchy.line_rects),
+        len(hierarchy.word_rects),
+        len(hierarchy.glyph_rects),
+        capacity
+    )
+    for array, values in zip(arrays, (
+            hierarchy.line_rects,
+            hierarchy.word_rects,
+            hierarchy.glyph_rects,
+            hierarchy.line_word_offsets,
+            hierarchy.word_glyph_offsets)):
+        array[...] = values
+
+    return len(hierarchy.line_rects), len(hierarchy.word_rects), len(hierarchy.glyph_rects)
+
+
+def decode_groups(buffer, offset: int, lines: int, words: int, glyphs: int) -> List[LineGroup]:
+    """
+    Reads back line groups written by encode_groups. The arrays are copied
+    out, so the buffer can be reused straight away.
+    """
+
+    line_rects, word_rects, glyph_rects, line_word_offsets, word_glyph_offsets = [
+        np.array(array, dtype=np.int64)
+        for array in _result_arrays(buffer, offset, lines, words, glyphs)
+    ]
+
+    return groups_from_arrays(
+        line_rects,
+        word_rects,
+        glyph_rects,
+        line_word_offsets,
+        word_glyph_offsets
+    )
+
+
+def encode_layout(layout: TextLayout) -> dict:
+    """
+    Converts a TextLayout into a JSON friendly dict
+    """
+
+    grid = layout.grid
+    spacing = layout.spacing
+    return {
+        "grid": None if grid is None else {
+            "cell_width": float(grid.cell_width),
+            "cell_height": None if grid.cell_height is None else int(grid.cell_height),
+            "origin": float(grid.origin),
+            "width": int(grid.edges[-1]),
+        },
+        "spacing": None if spacing is None else [
+            [int(bucket), float(ratio)]
+            for bucket, ratio in spacing.ratios.items()
+        ],
+    }
+
+
+def decode_layout(encoded: dict) -> TextLayout:
+    """
+    Reads back a TextLayout converted by encode_layout
+    """
+
+    grid = encoded["grid"]
+    spacing = encoded["spacing"]
+    return TextLayout(
+        None if grid is None else CellGrid(
+            grid["cell_width"],
+            grid["cell_height"],
+            grid["origin"],
+            grid["width"]
+        ),
+        None if spacing is None else WordSpacing({
+            bucket: ratio
+            for bucket, ratio in spacing
+        })
+    )
+
+
+def _result_arrays(buffer, offset: int, lines: int, words: int, glyphs: int, capacity: int=None):
+    """
+    Views onto the result arrays in the buffer, in the order line rects,
+    word rects, glyph rects, line word offsets, word glyph offsets.
+    """
+
+    sizes = [lines * 4, words * 4, glyphs * 4, lines + 1, words + 1]
+    itemsize = np.dtype(np.int32).itemsize
+    if capacity is not None and sum(sizes) * itemsize > capacity:
+        raise ValueError(f"{lines} lines, {words} words and {glyphs} glyphs don't fit in the results")
+
+    arrays = []
+    for size in sizes:
+        arrays.append(np.ndarray((size,), dtype=np.int32, buffer=buffer, offset=offset))
+        offset += size * itemsize
+
+    return [
+        arrays[0].reshape(-1, 4),
+        arrays[1].reshape(-1, 4),
+        arrays[2].reshape(-1, 4),
+        arrays[3],
+        arrays[4],
+    ]
+
+
+def serve(requests, responses):
+    """
+    The worker process's main loop. Reads JSON requests a line at a time and
+    writes a JSON response line for each.
+    """
+
+    def _respond(message: dict):
+        responses.write(json.dumps(message) + "\n")
+        responses.flush()
+
+    block = None
+    _respond({"ready": True, "pid": os.getpid()})
+    for line in requests:
+        request = json.loads(line)
+        if request.get("ping"):
+            _respond({"id": request["id"], "ok": True})
+            continue
+
+        try:
+            if block is None or block.name != request["shm"]:
+                if block is not None:
+                    block.close()
+                block = _attach(request["shm"])
+
+            start = time.perf_counter()
+            image = Image(np.ndarray(tuple(request["shape"]), dtype=np.uint8, buffer=block.buf))
+            mask, palette = calculate_mask_and_palette_from_config(
+                image,
+                request["mask_config"],
+                request["selection_colors"]
+            )
+            index = ProjectionIndex(mask)
+            layout = estimate_text_layout(
+                index,
+                word_whitespace_threshold=request["word_whitespace_threshold"]
+            )
+            groups = calculate_grouped_rects(
+                index,
+                word_whitespace_threshold=request["word_whitespace_threshold"],
+                layout=layout
+            )
+            counts = encode_groups(
+                block.buf,
+                request["result_offset"],
+                request["result_capacity"],
+                groups
+            )
+            # Release the views onto the block so it can be closed later
+            del image, mask, index, groups
+            _respond({
+                "id": request["id"],
+                "ok": True,
+                "counts": counts,
+                "palette": {
+                    "colors": palette.colors.tolist(),
+                    "area": [int(palette.area.x1), int(palette.area.y1),
+                             int(palette.area.x2), int(palette.area.y2)],
+                },
+                "layout": encode_layout(layout),
+                "segment_ms": round((time.perf_counter() - start) * 1000, 3),
+            })
+        except Exception as e:
+            _respond({"id": request["id"], "ok": False, "error": repr(e)})
+
+    if block is not None:
+        block.close()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches to the parent's shared block without taking ownership of it.
+    Before Python 3.13 attaching registers the block with this process's
+    resource tracker, which would unlink it when the worker exits.
+    """
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(block._name, "shared_memory")
+    except Exception:
+        pass
+
+    return block
+
+
+if __name__ == "__main__":
+    # Talon loads this file too, only serve when run as the worker process
+    serve(sys.stdin, sys.stdout)
@@ -0,0 +1,163 @@
+"""
+Checks that refreshing lines in sticky mode doesn't change them when the
+screen hasn't changed, using the stand-in talon package in talon_stub. Also
+checks that text highlighted by a selection is still split into the same
+words. Not actually used by Talon. Exits with an error if a check fails.
+"""
+
+if __name__ == "__main__":
+    # The above stops any of this from getting processed in the Talon environment
+    import sys
+
+    import numpy as np
+
+    from src.hierarchy import SegmentHierarchy
+    from src.segment import calculate_grouped_rects
+    from talon_stub.harness import load_image, load_talon_interface
+
+    EXAMPLES = [
+        ("examples/terminal.png", "mouse_fill"),
+        ("examples/terminal.png", "dominant_colors"),
+        ("examples/rich-text.png", "mouse_fill"),
+        ("examples/fixed-width.png", "mouse_fill"),
+        ("examples/selected-text.png", "mouse_fill"),
+    ]
+    # Marker indexes to select between, spread through the text
+    SELECTIONS = [(0, 1), (40, 42), (100, 101)]
+    SELECTION_COLOR = "#3584e4"
+
+    talon, talon_interface = load_talon_interface()
+
+    def show(data, background_detector, worker_python):
+        height, width, _ = data.shape
+        talon.screen.set_image(data)
+        talon.ui.window.rect = talon.types.Rect(0, 0, width, height)
+        # Mouse fill starts from the mouse, so put it on the background
+        talon.actions.mouse_position = (width - 5, height - 5)
+        talon.settings.set("user.telector_background_detector", background_detector)
+        talon.settings.set("user.telector_bounding_box", "active_window")
+        talon.settings.set("user.telector_input_delay", 0)
+        talon.settings.set("user.telector_sticky", 1)
+        talon.settings.set("user.telector_selection_background", SELECTION_COLOR)
+        talon.settings.set("user.telector_worker_python", worker_python)
+        talon_interface.segmentation_cache.clear()
+        talon.actions.user.telector_show()
+        if not talon.cron.wait():
+            raise RuntimeError("telector_show didn't finish")
+        talon.cron.run_pending()
+
+    def hierarchies():
+        return [
+            SegmentHierarchy(groups)
+            for _, groups in talon_interface.sticky_session.target_regions
+        ]
+
+    def same(hierarchies1, hierarchies2):
+        return all(
+            np.array_equal(getattr(first, name), getattr(second, name))
+            for first, second in zip(hierarchies1, hierarchies2)
+            for name in ("line_rects", "word_rects", "glyph_rects", "line_word_offsets")
+        )
+
+    def palettes_match():
+        """
+        Whether masking each region's lines with its background palette, as
+        refreshing does, gives the same lines as it was segmented into. The
+        palette is kept from showing, so this is checked against a fresh
+        capture of each whole region.
+        """
+
+        session = talon_interface.sticky_session
+        for region in session.regions:
+            image = talon_interface.screencap_to_image(region.bounding_rect)
+            groups = calculate_grouped_rects(
+                region.palette.mask(image),
+                word_whitespace_threshold=(
+                    None if session.word_spacing == -1 else session.word_spacing
+                ),
+                layout=region.layout
+            )
+            if not same([SegmentHierarchy(groups)], [SegmentHierarchy(region.groups)]):
+                return False
+
+        return True
+
+    def done():
+        """
+        Finishes an action, waiting for the sticky refresh to finish
+        """
+
+        talon.actions.user.telector_done()
+        # Starts the refresh, which finishes back on cron
+        talon.cron.run_pending()
+        if talon_interface.show_job is not None:
+            if not talon.cron.wait():
+                raise RuntimeError("sticky refresh didn't finish")
+            talon.cron.run_pending()
+
+    def highlight(data, rect):
+        """
+        Paints the selection color over the background of the given screen
+        rect, like an application showing a selection
+        """
+
+        x1, y1 = int(rect.x), int(rect.y)
+        x2, y2 = int(rect.x + rect.width), int(rect.y + rect.height)
+        area = data[y1:y2, x1:x2]
+        background = data[-1, -1]
+        area[(area == background).all(axis=2)] = [
+            int(SELECTION_COLOR[i:i + 2], 16) for i in (1, 3, 5)
+        ]
+
+    failures = []
+    # In process, then in a worker process
+    runs = [
+        (filename, background_detector, worker_python)
+        for worker_python in ("", sys.executable)
+        for filename, background_detector in EXAMPLES
+    ]
+    for filename, background_detector, worker_python in runs:
+        name = f"{filename} with {background_detector}{' in a worker' if worker_python else ''}"
+        data = load_image(filename)
+        show(data, background_detector, worker_python)
+        before = hierarchies()
+        marker_count = len(talon_interface.labels_ui.markers)
+
+        if not palettes_match():
+            failures.append(f"{name}: masking with the background palette gives different lines")
+
+        # Unchanged screen
+        for first, last in SELECTIONS:
+            markers = talon_interface.labels_ui.markers
+            first = min(first, len(markers) - 1)
+            last = min(last, len(markers) - 1)
+            talon.actions.user.telector_select(markers[first].label, markers[last].label)
+            done()
+        if len(talon_interface.labels_ui.markers) != marker_count or not same(before, hierarchies()):
+            failures.append(f"{name}: refreshing an unchanged screen changed the lines")
+
+        # The same words again, this time with the selection drawn
+        markers = talon_interface.labels_ui.markers
+        first, last = markers[0], markers[min(2, len(markers) - 1)]
+        talon.actions.user.telector_select(first.label, last.label)
+        selected = np.copy(data)
+        for marker in (first, last):
+            highlight(selected, marker.target_region)
+        talon.screen.set_image(selected)
+        done()
+        if len(talon_interface.labels_ui.markers) != marker_count:
+            failures.append(
+                f"{name}: {marker_count} labels before selecting, "
+                f"{len(talon_interface.labels_ui.markers)} after"
+            )
+
+        talon.actions.user.telector_hide()
+        print(f"{name}: {marker_count} labels")
+
+    if talon_interface.segmentation_worker is not None:
+        talon_interface.segmentation_worker.close()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    sys.exit(1 if failures else 0)
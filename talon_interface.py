@@ -2,14 +2,23 @@
 The Talon actions etc. provided by this package.
 """
 
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import os
+import threading
 import time
+import traceback
 
 import numpy as np
 from talon import (
     actions,
+    app,
     screen,
     ui,
     canvas,
+    cron,
     registry,
     settings,
     ctrl,
@@ -18,20 +27,26 @@ from talon import (
 )
 from talon.types import Rect as TalonRect
 
-# Import our modules then reset the Python path so as not to pollute the namespace
-# of other modules
-import sys
-import os
-orig_path = sys.path
-sys.path += [os.path.dirname(os.path.abspath(__file__))]
-from src.types import Image
-from src.mask import calculate_floodfill_mask, calculate_explicit_mask
-from src.segment import calculate_line_rects, calculate_word_rects
-sys.path = orig_path
-
-import marker_ui
-import importlib
-importlib.reload(marker_ui)
+# Talon loads this directory as a package, so our modules can be imported
+# relatively. Talon also takes care of reloading these when they change.
+from .src.areas import choose_text_area, find_text_areas
+from .src.cache import SegmentationCache, fingerprint
+from .src.hierarchy import SegmentHierarchy
+from .src.spatial import WordIndex, proximity_ranks
+from .src.mask import BackgroundPalette
+from .src.types import Image, Rect
+from .src.corpus import CorpusWriter
+from .src.config import (
+    calculate_relative,
+    calculate_mask_from_config,
+    calculate_mask_and_palette_from_config,
+    parse_region_specs
+)
+from .src.projection import ProjectionIndex
+from .src.segment import LineGroup, TextLayout, calculate_grouped_rects, estimate_text_layout
+from .src.worker import SegmentationWorker
+from . import marker_ui
+from . import input_driver as input_driver_module
 
 
 mod = Module()
@@ -64,9 +79,19 @@ setting_selection_background = mod.setting(
 setting_target_mode = mod.setting(
     "telector_target_mode",
     type=str,
-    desc="The type of target you want to find, one of lines or words",
+    desc="The type of target you want to find, one of lines, words or chars",
     default="words"
 )
+setting_regions = mod.setting(
+    "telector_regions",
+    type=str,
+    desc=(
+        "Several regions to look for text in at once, overriding telector_bounding_box "
+        "and telector_background_detector. A semicolon separated list of bounding boxes, "
+        "each optionally followed by | and a background detector."
+    ),
+    default=""
+)
 setting_marker_ui_offset = mod.setting(
     "telector_enable_marker_ui_offset",
     type=int,
@@ -76,6 +101,24 @@ setting_marker_ui_offset = mod.setting(
     ),
     default=0
 )
+setting_label_order = mod.setting(
+    "telector_label_order",
+    type=str,
+    desc=(
+        "The order labels are handed out in. 'reading' goes from the top left, "
+        "'proximity' gives the targets nearest the mouse the shortest labels."
+    ),
+    default="reading"
+)
+setting_sticky = mod.setting(
+    "telector_sticky",
+    type=int,
+    desc=(
+        "Set to 1 to keep the labels showing after selecting or clicking. Only "
+        "the lines acted on are captured and segmented again."
+    ),
+    default=0
+)
 setting_word_spacing = mod.setting(
     "telector_word_spacing",
     type=int,
@@ -92,6 +135,35 @@ setting_win_rect_workaround = mod.setting(
     desc="Turns on workaround for Talon active window linux rect bug (requires xdotool)",
     default=0
 )
+setting_input_delay = mod.setting(
+    "telector_input_delay",
+    type=int,
+    desc=(
+        "Milliseconds to wait during mouse drags and clicks. Set to -1 to have "
+        "this learnt per application (verified using telector_selection_background "
+        "if it's set)."
+    ),
+    default=-1
+)
+setting_record_dir = mod.setting(
+    "telector_record_dir",
+    type=str,
+    desc=(
+        "If set, every telector capture along with its settings, results and timings "
+        "is appended to a corpus in this directory. Replay it with replay_corpus.py."
+    ),
+    default=""
+)
+setting_worker_python = mod.setting(
+    "telector_worker_python",
+    type=str,
+    desc=(
+        "Path to a Python interpreter with numpy and opencv-python installed. If set, "
+        "masking and segmentation happen in a separate process run with it, keeping "
+        "Talon responsive on large captures."
+    ),
+    default=""
+)
 setting_debug_mode = mod.setting(
     "telector_debug_mode",
     type=int,
@@ -99,40 +171,117 @@ setting_debug_mode = mod.setting(
     default=0
 )
 
+# Performs mouse drags and clicks, learning the delays each app needs
+input_driver = input_driver_module.InputDriver()
+# The latest segmentation, shared by telector_show and the query actions
+segmentation_cache = SegmentationCache()
+# (groups, SegmentHierarchy, WordIndex) for the latest cached segmentation
+word_index_memo = None
+# Records frames when user.telector_record_dir is set
+corpus_writer = None
+# Where labels were last handed out from in proximity order, see find_label_focus
+label_focus = None
+# How far in pixels the mouse can move before labels are handed out from its
+# new position
+LABEL_FOCUS_TOLERANCE = 24
+# The SegmentationWorker when user.telector_worker_python is set
+segmentation_worker = None
 # Contains the currently displayed MarkerUi, or None if none is showing
 labels_ui = None
+# Contains the ShowJob whose segmentation is running in the background, or
+# None if there isn't one. Guarded by show_job_lock.
+show_job = None
+show_job_lock = threading.RLock()
+# The StickySession of the labels showing when user.telector_sticky is on
+sticky_session = None
+# How long to wait after hiding the labels in sticky mode before capturing
+# the lines acted on, so the application and the overlay have repainted
+STICKY_REFRESH_DELAY = "50ms"
+
+
+class ShowJob:  # pylint:disable=too-few-public-methods
+    """
+    A telector_show call, or a sticky refresh, whose masking and segmentation
+    is running on a worker thread. Actions that arrive before it finishes are
+    queued on it.
+    """
 
+    def __init__(self):
+        self.cancelled = False
+        self.queued_actions = []
 
-def screencap_to_image(rect: TalonRect) -> Image:
+
+class SegmentedRegion:  # pylint:disable=too-few-public-methods
     """
-    Captures the given rectangle off the screen and returns an OpenCV style numpy
-    array.
+    A region segmented by a ShowJob, along with what's needed to segment some
+    of its lines again in sticky mode
     """
 
-    img = screen.capture(rect.x, rect.y, rect.width, rect.height)
-    return Image(np.delete(np.array(img), 3, axis=2))
+    def __init__(self, bounding_rect: TalonRect, mask_config: str,
+                 groups: List[LineGroup], palette: Optional[BackgroundPalette]=None,
+                 layout: Optional[TextLayout]=None):
+        self.bounding_rect = bounding_rect
+        # Resolved, so it can be used again later
+        self.mask_config = mask_config
+        self.groups = groups
+        # The background found in the whole region, so refreshed lines can be
+        # masked without looking at the rest of it
+        self.palette = palette
+        # The character grid and word spacing of the whole region, so
+        # refreshed lines are segmented the same way as the rest
+        self.layout = layout
+
+
+class StickySession:  # pylint:disable=too-few-public-methods
+    """
+    What's needed to refresh some lines of the labels showing in sticky
+    mode, without capturing and segmenting everything again.
+    """
+
+    def __init__(self, regions: List[SegmentedRegion], word_spacing: int, ui_options: dict):
+        self.regions = regions
+        self.word_spacing = word_spacing
+        self.ui_options = ui_options
+        # Screen (top, bottom) spans acted on since the last refresh
+        self.touched = []
+
+    @property
+    def target_regions(self) -> List[Tuple[TalonRect, List[LineGroup]]]:
+        return [(region.bounding_rect, region.groups) for region in self.regions]
+
+    def touch(self, *rects: TalonRect):
+        self.touched.append((
+            min(rect.y for rect in rects),
+            max(rect.y + rect.height for rect in rects)
+        ))
 
 
-def calculate_relative(modifier: str, start: int, end: int) -> int:
+def find_segmentation_worker():
     """
-    Helper method for settings. Lets you specify numbers relative to a
-    range. For example:
+    The SegmentationWorker to segment with, or None to segment in process.
+    The worker process is started on first use and kept running.
+    """
+
+    global segmentation_worker
+
+    python = setting_worker_python.get()
+    if segmentation_worker is not None and segmentation_worker.python != python:
+        segmentation_worker.close()
+        segmentation_worker = None
+    if python != "" and segmentation_worker is None:
+        segmentation_worker = SegmentationWorker(python)
 
-        calculate_relative("-10", 0, 100) == 90
-        calculate_relative("10", 0, 100) == 10
-        calculate_relative("-0", 0, 100) == 100
+    return segmentation_worker
+
+
+def screencap_to_image(rect: TalonRect) -> Image:
+    """
+    Captures the given rectangle off the screen and returns an OpenCV style numpy
+    array.
     """
-    if modifier.startswith("-"):
-        modifier_ = int(modifier[1:])
-        rel_end = True
-    else:
-        modifier_ = int(modifier)
-        rel_end = False
 
-    if rel_end:
-        return end - modifier_
-    else:
-        return start + modifier_
+    img = screen.capture(rect.x, rect.y, rect.width, rect.height)
+    return Image(np.delete(np.array(img), 3, axis=2))
 
 
 def find_active_window_rect() -> TalonRect:
@@ -172,92 +321,339 @@ def find_active_window_rect() -> TalonRect:
 def find_bounding_rect(config: str=None) -> TalonRect:
     """
     Finds a bounding box to search for text in either based on an
-    explicit argument or on setting_bounding_box
+    explicit argument or on setting_bounding_box. For auto this is the part
+    of the window to look for text in, see find_text_area_region.
     """
 
     bounding_box_setting = config if config is not None else setting_bounding_box.get()
 
-    if bounding_box_setting.startswith("active_window"):
-        bits = bounding_box_setting.split(":")
-        mods = bits[1].split(" ") if len(bits) > 1 else ["0", "0", "-0", "-0"]
-        base_rect = find_active_window_rect()
-        _calc_pos = calculate_relative
-
-        x = _calc_pos(mods[0], base_rect.x, base_rect.x + base_rect.width)
-        y = _calc_pos(mods[1], base_rect.y, base_rect.y + base_rect.height)
-        rect = TalonRect(
-            x,
-            y,
-            _calc_pos(mods[2], 0, base_rect.width) - int(mods[0]),
-            _calc_pos(mods[3], 0, base_rect.height) - int(mods[1]),
-        )
+    if bounding_box_setting.startswith(("active_window", "auto")):
+        rect = find_window_offset_rect(bounding_box_setting)
 
     return rect
 
 
-def find_mask(image: Image, bounding_rect: TalonRect, config: str=None) -> 'src.types.Mask':
+def is_auto_bounding_box(config: str=None) -> bool:
+    bounding_box_setting = config if config is not None else setting_bounding_box.get()
+    return bounding_box_setting.startswith("auto")
+
+
+def find_window_offset_rect(bounding_box_setting: str) -> TalonRect:
     """
-    Finds a foreground/background mask for use as input to the segmentation
-    system. Can be given explicit configuration, or pull it from
-    setting_background_detector.
+    The part of the active window given by the offsets after the colon in a
+    bounding box setting, or the whole window if there aren't any.
+    """
+
+    bits = bounding_box_setting.split(":")
+    mods = bits[1].split(" ") if len(bits) > 1 else ["0", "0", "-0", "-0"]
+    base_rect = find_active_window_rect()
+    _calc_pos = calculate_relative
+
+    x = _calc_pos(mods[0], base_rect.x, base_rect.x + base_rect.width)
+    y = _calc_pos(mods[1], base_rect.y, base_rect.y + base_rect.height)
+    return TalonRect(
+        x,
+        y,
+        _calc_pos(mods[2], 0, base_rect.width) - int(mods[0]),
+        _calc_pos(mods[3], 0, base_rect.height) - int(mods[1]),
+    )
+
+
+def find_text_area_region(image: Image, window_rect: TalonRect, background_detector: str,
+                          mouse_pos: Tuple[float, float]) -> Tuple[TalonRect, str]:
+    """
+    Narrows an auto region down to the area of text under the mouse, or the
+    largest area of text if the mouse isn't over one, returning its bounding
+    rect and resolved mask config. image is a capture of window_rect. Falls
+    back to the whole of window_rect if no text is found. Doesn't touch
+    Talon's state, so can be run off the action thread.
+    """
+
+    mouse_x = int(mouse_pos[0] - window_rect.x)
+    mouse_y = int(mouse_pos[1] - window_rect.y)
+    area = choose_text_area(find_text_areas(image), (mouse_x, mouse_y))
+    # mouse_fill needs the mouse to be inside the region
+    if area is not None and (
+            background_detector != "mouse_fill" or
+            area.x1 <= mouse_x < area.x2 and area.y1 <= mouse_y < area.y2):
+        bounding_rect = TalonRect(
+            window_rect.x + area.x1,
+            window_rect.y + area.y1,
+            area.x2 - area.x1,
+            area.y2 - area.y1,
+        )
+    else:
+        bounding_rect = window_rect
+
+    return bounding_rect, resolve_mask_config(bounding_rect, background_detector, mouse_pos)
+
+
+def find_region(bounding_box: str=None, background_detector: str=None) -> Tuple[TalonRect, str, bool]:
+    """
+    The bounding rect and resolved mask config of a region, and whether it's
+    an auto region. Finding the text area of an auto region means capturing
+    it, so that's left to find_text_area_region and its mask config is left
+    unresolved until then.
+    """
+
+    bounding_rect = find_bounding_rect(bounding_box)
+    if is_auto_bounding_box(bounding_box):
+        if background_detector is None:
+            background_detector = setting_background_detector.get()
+        return bounding_rect, background_detector, True
+
+    return bounding_rect, resolve_mask_config(bounding_rect, background_detector), False
+
+
+def find_regions() -> List[Tuple[TalonRect, str, bool]]:
+    """
+    The regions from setting_regions as given by find_region, or just the
+    single region described by the bounding box and background detector
+    settings if it's empty.
+    """
+
+    specs = parse_region_specs(setting_regions.get())
+    if len(specs) == 0:
+        specs = [(None, None)]
+
+    return [
+        find_region(bounding_box, background_detector)
+        for bounding_box, background_detector in specs
+    ]
+
+
+def union_rect(rects: List[TalonRect]) -> TalonRect:
+    """
+    The smallest rect containing all the given rects
+    """
+
+    x1 = min(rect.x for rect in rects)
+    y1 = min(rect.y for rect in rects)
+    x2 = max(rect.x + rect.width for rect in rects)
+    y2 = max(rect.y + rect.height for rect in rects)
+
+    return TalonRect(x1, y1, x2 - x1, y2 - y1)
+
+
+def crop_image(image: Image, image_rect: TalonRect, rect: TalonRect) -> Image:
+    """
+    The part of an image captured from image_rect which covers rect
+    """
+
+    x = int(rect.x - image_rect.x)
+    y = int(rect.y - image_rect.y)
+    return Image(image.data[y:y + int(rect.height), x:x + int(rect.width)])
+
+
+def resolve_mask_config(bounding_rect: TalonRect, config: str=None,
+                        mouse_pos: Tuple[float, float]=None) -> str:
+    """
+    Turns the mask config (or setting_background_detector) into one which
+    doesn't depend on the current state of Talon, so find_mask can be run
+    later or from another thread. mouse_fill uses mouse_pos if it's given
+    rather than the current mouse position, and dominant_colors if the mouse
+    isn't inside bounding_rect, as there's nothing to flood fill from.
     """
 
     background_detector_setting = config if config is not None else setting_background_detector.get()
 
     if background_detector_setting == "mouse_fill":
-        mouse_pos = ctrl.mouse_pos()
+        if mouse_pos is None:
+            mouse_pos = ctrl.mouse_pos()
         # Ints are because OSX gets floats for both mouse pos and the bounding rect
         mouse_norm_y = int(mouse_pos[1] - bounding_rect.y)
         mouse_norm_x = int(mouse_pos[0] - bounding_rect.x)
-        mask = calculate_floodfill_mask(
-            image,
-            (mouse_norm_x, mouse_norm_y)
-        )
-    elif background_detector_setting.startswith("pixel_fill"):
-        bits = background_detector_setting.split(":")
-        mods = bits[1].split(" ") if len(bits) > 1 else ["0", "0"]
-        mask = calculate_floodfill_mask(
-            image,
-            (
-                calculate_relative(mods[0], 0, bounding_rect.width),
-                calculate_relative(mods[1], 0, bounding_rect.height),
-            )
-        )
-    elif background_detector_setting.startswith("explicit_colors"):
-        _, colors_str = background_detector_setting.split(":")
-        colors = colors_str.split(" ")
-        mask = calculate_explicit_mask(
-            image,
-            colors
-        )
+        if not (0 <= mouse_norm_x < int(bounding_rect.width) and
+                0 <= mouse_norm_y < int(bounding_rect.height)):
+            return "dominant_colors"
+        return f"pixel_fill:{mouse_norm_x} {mouse_norm_y}"
 
-    return mask
+    return background_detector_setting
 
 
-def find_grouped_rects(bounding_rect: TalonRect, mask_config: str=None):
+def find_mask(image: Image, bounding_rect: TalonRect, config: str=None,
+              selection_colors: Optional[List[str]]=None) -> 'src.types.Mask':
     """
-    Produces a list of dicts representing lines. Each line contains a list
-    of word rectangles contained within it.
+    Finds a foreground/background mask for use as input to the segmentation
+    system. Can be given explicit configuration, or pull it from
+    setting_background_detector. Any selection_colors are background too.
+    """
+
+    return calculate_mask_from_config(
+        image,
+        resolve_mask_config(bounding_rect, config),
+        selection_colors
+    )
+
+
+def find_selection_colors() -> Optional[List[str]]:
+    """
+    The background colors of selected text to mask as background, from
+    setting_selection_background. Text selected by telector_select is
+    refreshed in sticky mode, so must be masked the same way as the rest.
+    """
+
+    selection_background = setting_selection_background.get()
+    return [selection_background] if selection_background else None
+
+
+def find_projection_index(bounding_rect: TalonRect, mask_config: str=None) -> ProjectionIndex:
+    """
+    Captures the bounding rect and produces an index of its foreground pixels
+    which can be segmented repeatedly with different settings.
     """
 
     image = screencap_to_image(bounding_rect)
     mask = find_mask(image, bounding_rect, mask_config)
 
-    line_rects = calculate_line_rects(mask)
-    result = []
-    for line_rect in line_rects:
+    return ProjectionIndex(mask)
+
+
+def group_rects(index: ProjectionIndex, word_spacing: int=None, layout: TextLayout=None):
+    """
+    Segments an index from find_projection_index into lines and words using
+    the given word spacing, or the current word spacing setting. See
+    calculate_grouped_rects for layout.
+    """
+
+    if word_spacing is None:
         word_spacing = setting_word_spacing.get()
-        word_rects = calculate_word_rects(
-            mask,
-            line_rect,
-            word_whitespace_threshold=None if word_spacing == -1 else word_spacing
-        )
-        result.append({
-            "line_rect": line_rect,
-            "word_rects": word_rects
-        })
+    return calculate_grouped_rects(
+        index,
+        word_whitespace_threshold=None if word_spacing == -1 else word_spacing,
+        layout=layout
+    )
+
+
+def segmentation_key(bounding_rect: TalonRect, mask_config: str, word_spacing: int,
+                     selection_colors: Optional[List[str]]) -> tuple:
+    """
+    Identifies the inputs to a segmentation for SegmentationCache. Takes an
+    already resolved mask config.
+    """
+
+    return (
+        bounding_rect.x,
+        bounding_rect.y,
+        bounding_rect.width,
+        bounding_rect.height,
+        mask_config,
+        word_spacing,
+        tuple(selection_colors or ()),
+    )
+
+
+def find_cached_segmentation() -> Tuple[TalonRect, List[LineGroup]]:
+    """
+    Segments the text in the current bounding rect, reusing the previous
+    result if it was made recently or the screen hasn't changed since.
+    """
+
+    bounding_rect, mask_config, auto = find_region()
+    word_spacing = setting_word_spacing.get()
+    selection_colors = find_selection_colors()
+    key = segmentation_key(bounding_rect, mask_config, word_spacing, selection_colors)
+    if auto:
+        # Keyed on the settings rather than the text area, which can only be
+        # found from a capture
+        key = (setting_bounding_box.get(),) + key
+    now = time.monotonic()
+
+    cached = segmentation_cache.get(key, now)
+    if cached is None:
+        image = screencap_to_image(bounding_rect)
+        cached = segmentation_cache.validate(key, image, now)
+        if cached is None and auto:
+            area_rect, area_mask_config = find_text_area_region(
+                image,
+                bounding_rect,
+                mask_config,
+                ctrl.mouse_pos()
+            )
+            index = ProjectionIndex(
+                find_mask(
+                    crop_image(image, bounding_rect, area_rect),
+                    area_rect,
+                    area_mask_config,
+                    selection_colors
+                )
+            )
+            # Stored relative to bounding_rect, like the key
+            groups = SegmentHierarchy(group_rects(index, word_spacing)).to_groups(
+                dx=int(area_rect.x - bounding_rect.x),
+                dy=int(area_rect.y - bounding_rect.y)
+            )
+            cached = segmentation_cache.put(key, image, None, groups, now)
+        elif cached is None:
+            index = ProjectionIndex(find_mask(image, bounding_rect, mask_config, selection_colors))
+            cached = segmentation_cache.put(
+                key,
+                image,
+                index,
+                group_rects(index, word_spacing),
+                now
+            )
+
+    return bounding_rect, cached.groups
+
+
+def find_cached_word_index() -> Tuple[TalonRect, SegmentHierarchy, WordIndex]:
+    """
+    Like find_cached_segmentation, but also gives a SegmentHierarchy and
+    WordIndex for the result. These are reused while the result is.
+    """
+
+    global word_index_memo
+
+    bounding_rect, groups = find_cached_segmentation()
+    memo = word_index_memo
+    if memo is None or memo[0] is not groups:
+        hierarchy = SegmentHierarchy(groups)
+        memo = (groups, hierarchy, WordIndex(hierarchy))
+        word_index_memo = memo
+
+    return bounding_rect, memo[1], memo[2]
+
 
-    return result
+def select_rects(rect1: TalonRect, rect2: TalonRect):
+    """
+    Drags from the start of the first rect to the end of the second, then
+    puts the mouse back where it was.
+    """
+
+    init_mouse_x = actions.mouse_x()
+    init_mouse_y = actions.mouse_y()
+
+    input_driver.drag(
+        ui.active_app().name,
+        (rect1.x, rect1.y + rect1.height / 2),
+        # The bounding box looks fine in a screenshot but +2 helps to get
+        # the whole word with my terminal and seems to work OK elsewhere.
+        # Guess it's up to the application how it responds.
+        (rect2.x + rect2.width+2, rect2.y + rect2.height / 2),
+        verify_rect=rect1,
+        selection_color=setting_selection_background.get(),
+        fixed_delay=_fixed_input_delay()
+    )
+
+    actions.mouse_move(
+        init_mouse_x,
+        init_mouse_y
+    )
+
+
+def to_compact_rect(bounding_rect: TalonRect, rect: 'src.types.Rect') -> tuple:
+    """
+    Converts a rect relative to the bounding rect into a screen
+    (x, y, width, height) tuple
+    """
+
+    return (
+        bounding_rect.x + rect.x1,
+        bounding_rect.y + rect.y1,
+        rect.x2 - rect.x1,
+        rect.y2 - rect.y1,
+    )
 
 
 def anchor_generator() -> 'Iterable[str]':
@@ -275,6 +671,74 @@ def anchor_generator() -> 'Iterable[str]':
                 yield f"{letter1}{letter2}"
 
 
+def find_label_focus() -> Optional[Tuple[float, float]]:
+    """
+    The screen position labels are handed out from, nearest first, or None
+    to hand them out in reading order. Reuses the last position unless the
+    mouse has moved away from it, so showing the labels again over the same
+    text gives the same labels.
+    """
+
+    global label_focus
+
+    if setting_label_order.get() != "proximity":
+        return None
+
+    mouse_pos = ctrl.mouse_pos()
+    if (
+            label_focus is None or
+            abs(mouse_pos[0] - label_focus[0]) > LABEL_FOCUS_TOLERANCE or
+            abs(mouse_pos[1] - label_focus[1]) > LABEL_FOCUS_TOLERANCE):
+        label_focus = (mouse_pos[0], mouse_pos[1])
+
+    return label_focus
+
+
+def assign_labels(rects: np.ndarray, focus: Optional[Tuple[float, float]],
+                  kept_labels: Optional[dict]=None) -> List[Optional[str]]:
+    """
+    Labels for an (n, 4) array of x1, y1, x2, y2 screen rects in reading
+    order, given in reading order or nearest the focus first if there is
+    one. None for rects left over once the labels run out.
+
+    kept_labels maps the label_key of rects to labels they should keep, e.g.
+    from the labels already showing. Other rects get the labels left over.
+    """
+
+    labels = list(anchor_generator())
+    if focus is None:
+        ranks = np.arange(len(rects))
+    else:
+        ranks = proximity_ranks(rects, focus[0], focus[1])
+
+    if kept_labels is None:
+        return [
+            labels[rank] if rank < len(labels) else None
+            for rank in ranks.tolist()
+        ]
+
+    assigned = [kept_labels.get(label_key(rect)) for rect in rects.tolist()]
+    used = set(assigned)
+    free_labels = (label for label in labels if label not in used)
+    for i in np.argsort(ranks).tolist():
+        if assigned[i] is None:
+            assigned[i] = next(free_labels, None)
+
+    return assigned
+
+
+def label_key(rect) -> tuple:
+    """
+    Identifies a labelled target by its x1, y1, x2, y2 screen position
+    """
+
+    return tuple(int(round(value)) for value in rect)
+
+
+def talon_rect_label_key(rect: TalonRect) -> tuple:
+    return label_key((rect.x, rect.y, rect.x + rect.width, rect.y + rect.height))
+
+
 @mod.action_class
 class TelectorActions:
     """
@@ -287,96 +751,113 @@ class TelectorActions:
             target_mode: str=""):
         """
         Locate and show labels on text. Can be given explicit search
-        parameters or will pull them from settings.
+        parameters or will pull them from settings. With no explicit
+        bounding rect config every region in telector_regions is searched.
         """
 
-        global labels_ui
+        global labels_ui, show_job, sticky_session
+        _cancel_show_job()
+        sticky_session = None
         if labels_ui is not None:
-            labels_ui.hide()
+            labels_ui.destroy()
+            labels_ui = None
 
-        bounding_rect_config_ = \
-            None if bounding_rect_config == "" else bounding_rect_config
-        mask_config_ = \
-            None if mask_config == "" else mask_config
         target_mode_ = \
             setting_target_mode.get() if target_mode == "" else target_mode
-        bounding_rect = find_bounding_rect(bounding_rect_config_)
-
-        target_groups = find_grouped_rects(bounding_rect, mask_config_)
-        if target_mode_ == "lines":
-            target_rects = [
-                group["line_rect"]
-                for group in target_groups
-            ]
+        if bounding_rect_config == "" and mask_config == "":
+            regions = find_regions()
         else:
-            target_rects = [
-                word_rect
-                for group in target_groups
-                for word_rect in group["word_rects"]
-            ]
+            regions = [find_region(
+                None if bounding_rect_config == "" else bounding_rect_config,
+                None if mask_config == "" else mask_config
+            )]
+
+        # Read everything that depends on Talon's state now, only the screen
+        # capture is done inline. Masking and segmentation happen on a worker
+        # thread and the UI is shown from a cron callback once they're done.
+        # All the regions come from a single capture.
+        ui_options = {
+            "target_mode": target_mode_,
+            "use_underline_ui": 'user.telector_ui_underline' in registry.tags,
+            "offset_downward": setting_marker_ui_offset.get() == 1,
+            "label_focus": find_label_focus(),
+            "sticky": setting_sticky.get() == 1,
+            "selection_colors": find_selection_colors(),
+        }
+        word_spacing = setting_word_spacing.get()
+        worker = find_segmentation_worker()
+        mouse_pos = ctrl.mouse_pos()
+        capture_rect = union_rect([bounding_rect for bounding_rect, _, _ in regions])
+        image = screencap_to_image(capture_rect)
 
-        use_underline_ui = 'user.telector_ui_underline' in registry.tags
-        if use_underline_ui:
-            labels_ui = marker_ui.UnderlineMarkerUi(
-                [
-                    marker_ui.UnderlineMarkerUi.Group(
-                        label=label,
-                        line_rect=TalonRect(
-                            bounding_rect.x + line_rect.x1,
-                            bounding_rect.y + line_rect.y1,
-                            line_rect.x2 - line_rect.x1,
-                            line_rect.y2 - line_rect.y1
-                        ),
-                        item_rects=[
-                            TalonRect(
-                                bounding_rect.x + rect.x1,
-                                bounding_rect.y + rect.y1,
-                                rect.x2 - rect.x1,
-                                rect.y2 - rect.y1
-                            )
-                            for rect in group["word_rects"]
-                        ]
-                    )
-                    for group, label in zip(target_groups, anchor_generator())
-                    for line_rect in (group["line_rect"],)
-                ]
-            )
-        else:
-            labels_ui = marker_ui.MarkerUi(
-                [
-                    marker_ui.MarkerUi.Marker(
-                        target_region=TalonRect(
-                            bounding_rect.x + rect.x1,
-                            bounding_rect.y + rect.y1,
-                            rect.x2 - rect.x1,
-                            rect.y2 - rect.y1
-                        ),
-                        label=label
-                    )
-                    for rect, label in zip(target_rects, anchor_generator())
-                ],
-                offset_downward=setting_marker_ui_offset.get() == 1
-            )
-        labels_ui.show()
+        job = ShowJob()
+        with show_job_lock:
+            show_job = job
+        # Set the tag straight away so follow up commands can be queued
         ctx.tags = ["user.telector_showing"]
 
+        threading.Thread(
+            target=_run_show_job,
+            args=(job, image, capture_rect, regions, word_spacing, ui_options,
+                  os.path.expanduser(setting_record_dir.get()), worker, mouse_pos),
+            daemon=True
+        ).start()
+
     def telector_hide():
         """
-        Hide any visible telector UI
+        Hide any visible telector UI. If the UI is still being prepared this
+        cancels it, unless other actions are waiting on it in which case the hide
+        happens after them.
         """
 
-        global labels_ui
+        if _queue_if_pending("telector_hide", (), behind_others=True):
+            return
+        _cancel_show_job()
+
+        global labels_ui, sticky_session
+        sticky_session = None
         if labels_ui is not None:
             labels_ui.destroy()
             labels_ui = None
         ctx.tags = []
 
+    def telector_done():
+        """
+        Finishes acting on the labels. Hides them, unless user.telector_sticky
+        is on, in which case just the lines acted on are captured and
+        segmented again and the labels stay up for the next action.
+        """
+
+        global show_job
+
+        if _queue_if_pending("telector_done", ()):
+            return
+
+        if sticky_session is None or labels_ui is None:
+            actions.user.telector_hide()
+            return
+
+        # Keep the labels out of the capture
+        labels_ui.hide()
+        session = sticky_session
+        # Actions that arrive before the labels are back wait for them, so
+        # they see the refreshed lines
+        job = ShowJob()
+        with show_job_lock:
+            show_job = job
+        cron.after(STICKY_REFRESH_DELAY, lambda: _start_sticky_refresh(job, session))
+
     def telector_select(anchor1: str, anchor2: str):
         """
         Selects the text indicated by the given anchors
         """
 
+        if _queue_if_pending("telector_select", (anchor1, anchor2)):
+            return
+
         global labels_ui
+        if labels_ui is None:
+            return
 
         rect1 = labels_ui.find_rect(anchor1)
         rect2 = labels_ui.find_rect(anchor2)
@@ -385,35 +866,21 @@ class TelectorActions:
             # Couldn't find them, quit
             return
 
-        init_mouse_x = actions.mouse_x()
-        init_mouse_y = actions.mouse_y()
-
-        actions.mouse_move(
-            rect1.x,
-            rect1.y + rect1.height / 2,
-        )
-        actions.mouse_drag(0)
-        time.sleep(0.1)
-        actions.mouse_move(
-            # The bounding box looks fine in a screenshot but +2 helps to get
-            # the whole word with my terminal and seems to work OK elsewhere.
-            # Guess it's up to the application how it responds.
-            rect2.x + rect2.width+2,
-            rect2.y + rect2.height / 2
-        )
-        actions.mouse_release(0)
-
-        actions.mouse_move(
-            init_mouse_x,
-            init_mouse_y
-        )
+        if sticky_session is not None:
+            sticky_session.touch(rect1, rect2)
+        select_rects(rect1, rect2)
 
     def telector_click(anchor: str, button:int = 0):
         """
         Clicks the given anchor
         """
 
+        if _queue_if_pending("telector_click", (anchor, button)):
+            return
+
         global labels_ui
+        if labels_ui is None:
+            return
 
         rect = labels_ui.find_rect(anchor)
 
@@ -421,27 +888,650 @@ class TelectorActions:
             # Couldn't find them, quit
             return
 
+        if sticky_session is not None:
+            sticky_session.touch(rect)
         init_mouse_x = actions.mouse_x()
         init_mouse_y = actions.mouse_y()
 
-        actions.mouse_move(
-            rect.x + rect.width / 2,
-            rect.y + rect.height / 2,
+        input_driver.click(
+            ui.active_app().name,
+            (rect.x + rect.width / 2, rect.y + rect.height / 2),
+            button,
+            fixed_delay=_fixed_input_delay()
         )
-        actions.mouse_click(button)
-        time.sleep(0.1)
 
         actions.mouse_move(
             init_mouse_x,
             init_mouse_y
         )
 
+    def telector_words() -> list:
+        """
+        Returns the (x, y, width, height) screen rects of the words in the
+        current bounding box, in reading order
+        """
+
+        bounding_rect, groups = find_cached_segmentation()
+        return [
+            to_compact_rect(bounding_rect, rect)
+            for group in groups
+            for rect in group.word_rects
+        ]
+
+    def telector_word_at(x: int, y: int) -> tuple:
+        """
+        Returns the (x, y, width, height) screen rect of the word under the
+        given screen position, or None if there isn't one
+        """
+
+        bounding_rect, hierarchy, word_index = find_cached_word_index()
+        word = word_index.word_at(x - bounding_rect.x, y - bounding_rect.y)
+        if word is None:
+            return None
+
+        return to_compact_rect(bounding_rect, Rect(*hierarchy.word_rects[word].tolist()))
+
+    def telector_line_of(x: int, y: int) -> tuple:
+        """
+        Returns the (x, y, width, height) screen rect of the line at the given
+        screen position, or None if there isn't one
+        """
+
+        bounding_rect, groups = find_cached_segmentation()
+        rel_y = y - bounding_rect.y
+        for group in groups:
+            line_rect = group.line_rect
+            if line_rect.y1 <= rel_y < line_rect.y2:
+                return to_compact_rect(bounding_rect, line_rect)
+
+        return None
+
+    def telector_select_mouse_word():
+        """
+        Selects the word nearest the mouse without showing any labels
+        """
+
+        actions.user.telector_select_mouse_words(0)
+
+    def telector_select_mouse_words(count: int):
+        """
+        Selects from the word nearest the mouse to the word count words
+        further on, without showing any labels
+        """
+
+        bounding_rect, hierarchy, word_index = find_cached_word_index()
+        mouse_x, mouse_y = ctrl.mouse_pos()
+        word = word_index.nearest_word(mouse_x - bounding_rect.x, mouse_y - bounding_rect.y)
+        if word is None:
+            return
+
+        last_word = min(word + count, len(word_index) - 1)
+        word_rects = hierarchy.word_rects
+        select_rects(
+            to_talon_rect(bounding_rect, Rect(*word_rects[word].tolist())),
+            to_talon_rect(bounding_rect, Rect(*word_rects[last_word].tolist()))
+        )
+
+    def telector_input_stats() -> str:
+        """
+        Describes the mouse input delays learnt for each application
+        """
+
+        return "\n".join(
+            f"{app_name}: {stats}"
+            for app_name, stats in input_driver.stats().items()
+        )
+
+    def telector_key(key: str):
+        """
+        Presses the given key, after any telector actions that are waiting for
+        the UI to be prepared
+        """
+
+        if _queue_if_pending("telector_key", (key,)):
+            return
+
+        actions.key(key)
+
+
+def to_talon_rect(bounding_rect: TalonRect, rect: 'src.types.Rect') -> TalonRect:
+    """
+    Converts a rect relative to the bounding rect into a screen TalonRect
+    """
+
+    return TalonRect(
+        bounding_rect.x + rect.x1,
+        bounding_rect.y + rect.y1,
+        rect.x2 - rect.x1,
+        rect.y2 - rect.y1
+    )
+
+
+class LazyItemRects(Sequence):
+    """
+    The word or glyph cluster rects of a LineGroup as screen TalonRects.
+    Nothing is calculated until the rects are first accessed.
+    """
+
+    def __init__(self, bounding_rect: TalonRect, group: LineGroup, target_mode: str):
+        self.bounding_rect = bounding_rect
+        self.group = group
+        self.target_mode = target_mode
+        self._rects = None
+
+    def __getitem__(self, index):
+        return self._get_rects()[index]
+
+    def __len__(self):
+        return len(self._get_rects())
+
+    def _get_rects(self) -> List[TalonRect]:
+        if self._rects is None:
+            item_rects = \
+                self.group.glyph_rects if self.target_mode == "chars" \
+                else self.group.word_rects
+            self._rects = [
+                to_talon_rect(self.bounding_rect, rect)
+                for rect in item_rects
+            ]
+
+        return self._rects
+
+
+def create_labels_ui(target_regions: List[Tuple[TalonRect, List[LineGroup]]], ui_options: dict,
+                     previous_ui=None):
+    """
+    Creates (but doesn't show) the marker UI for the given segmentation
+    results, a list of (bounding rect, line groups) pairs with one for each
+    region. Labels carry on from one region to the next. Targets which were
+    also in previous_ui keep their labels.
+    """
+
+    target_mode = ui_options["target_mode"]
+    kept_labels = None
+    if isinstance(previous_ui, marker_ui.UnderlineMarkerUi):
+        kept_labels = {
+            talon_rect_label_key(group.line_rect): group.label
+            for group in previous_ui.groups
+        }
+    elif isinstance(previous_ui, marker_ui.MarkerUi):
+        kept_labels = {
+            talon_rect_label_key(marker.target_region): marker.label
+            for marker in previous_ui.markers
+        }
+
+    if ui_options["use_underline_ui"]:
+        region_groups = [
+            (bounding_rect, group)
+            for bounding_rect, target_groups in target_regions
+            for group in target_groups
+        ]
+        labels = assign_labels(
+            _to_screen_array(
+                (bounding_rect, group.line_rect)
+                for bounding_rect, group in region_groups
+            ),
+            ui_options["label_focus"],
+            kept_labels
+        )
+        return marker_ui.UnderlineMarkerUi(
+            [
+                marker_ui.UnderlineMarkerUi.Group(
+                    label=label,
+                    line_rect=to_talon_rect(bounding_rect, group.line_rect),
+                    item_rects=LazyItemRects(bounding_rect, group, target_mode)
+                )
+                for (bounding_rect, group), label in zip(region_groups, labels)
+                if label is not None
+            ]
+        )
+
+    region_arrays = []
+    for bounding_rect, target_groups in target_regions:
+        if target_mode == "lines":
+            # Avoid building the hierarchy, it would segment every line into words
+            region_array = _to_screen_array(
+                (bounding_rect, group.line_rect)
+                for group in target_groups
+            )
+        else:
+            offset = np.array([bounding_rect.x, bounding_rect.y] * 2)
+            region_array = SegmentHierarchy(target_groups).target_array(target_mode) + offset
+
+        region_arrays.append(region_array)
+
+    target_rects = np.concatenate(region_arrays) if len(region_arrays) > 0 else np.zeros((0, 4))
+    return marker_ui.MarkerUi(
+        [
+            marker_ui.MarkerUi.Marker(
+                target_region=TalonRect(x1, y1, x2 - x1, y2 - y1),
+                label=label
+            )
+            for (x1, y1, x2, y2), label in zip(
+                target_rects.tolist(),
+                assign_labels(target_rects, ui_options["label_focus"], kept_labels)
+            )
+            if label is not None
+        ],
+        offset_downward=ui_options["offset_downward"]
+    )
+
+
+def _to_screen_array(rects) -> np.ndarray:
+    """
+    An (n, 4) array of x1, y1, x2, y2 screen positions from (bounding rect,
+    relative rect) pairs
+    """
+
+    return np.array(
+        [
+            (
+                bounding_rect.x + rect.x1,
+                bounding_rect.y + rect.y1,
+                bounding_rect.x + rect.x2,
+                bounding_rect.y + rect.y2,
+            )
+            for bounding_rect, rect in rects
+        ]
+    ).reshape(-1, 4)
+
+
+def _run_show_job(job: ShowJob, image: Image, capture_rect: TalonRect,
+                  regions: List[Tuple[TalonRect, str, bool]], word_spacing: int,
+                  ui_options: dict, record_dir: str="",
+                  worker: SegmentationWorker=None,
+                  mouse_pos: Tuple[float, float]=None):
+    """
+    Worker thread half of telector_show. image is a capture of capture_rect,
+    which contains all the regions from find_region. Auto regions are
+    narrowed down to their text area here, using the mouse position from
+    when telector_show was called. If a SegmentationWorker is given it's
+    used in preference to segmenting here. A region that fails is left out
+    rather than losing the labels of the others.
+    """
+
+    def _segment(region):
+        bounding_rect, mask_config, auto = region
+        try:
+            if auto:
+                bounding_rect, mask_config = find_text_area_region(
+                    crop_image(image, capture_rect, bounding_rect),
+                    bounding_rect,
+                    mask_config,
+                    mouse_pos
+                )
+            return _segment_region(
+                job,
+                crop_image(image, capture_rect, bounding_rect),
+                bounding_rect,
+                mask_config,
+                word_spacing,
+                ui_options,
+                record_dir,
+                worker,
+                # The cache only holds one result, so regions would just
+                # evict each other
+                use_cache=len(regions) == 1
+            )
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    if len(regions) == 1:
+        segmented_regions = [_segment(regions[0])]
+    else:
+        # Masking and segmentation are mostly numpy and OpenCV calls which
+        # release the GIL, so the regions can be processed in parallel
+        with ThreadPoolExecutor(max_workers=min(len(regions), os.cpu_count() or 1)) as executor:
+            segmented_regions = list(executor.map(_segment, regions))
+    segmented_regions = [region for region in segmented_regions if region is not None]
+    if len(segmented_regions) == 0:
+        segmented_regions = None
+
+    if not job.cancelled:
+        cron.after(
+            "0ms",
+            lambda: _finish_show_job(
+                job,
+                [
+                    (region.bounding_rect, region.groups)
+                    for region in segmented_regions
+                ] if segmented_regions is not None else None,
+                ui_options,
+                StickySession(segmented_regions, word_spacing, ui_options)
+                if ui_options["sticky"] and segmented_regions is not None else None
+            )
+        )
+
+
+def _segment_region(job: ShowJob, image: Image, bounding_rect: TalonRect,
+                    mask_config: str, word_spacing: int, ui_options: dict,
+                    record_dir: str, worker: SegmentationWorker,
+                    use_cache: bool) -> SegmentedRegion:
+    """
+    Masks and segments a single region for _run_show_job. Gives up early,
+    returning no groups, if the job is cancelled.
+    """
+
+    # Reuse the last segmentation if the screen hasn't changed, e.g. when
+    # just switching target modes
+    key = segmentation_key(bounding_rect, mask_config, word_spacing, ui_options["selection_colors"])
+    cached = segmentation_cache.validate(key, image, time.monotonic()) if use_cache else None
+    if cached is not None and ui_options["sticky"] and cached.palette is None:
+        # From find_cached_segmentation, which doesn't keep what's needed to
+        # refresh lines
+        cached = None
+    word_whitespace_threshold = None if word_spacing == -1 else word_spacing
+    start = time.perf_counter()
+    timings = {}
+    target_groups = None
+    palette = None
+    layout = None
+    if cached is not None:
+        target_groups = cached.groups
+        palette = cached.palette
+        layout = cached.layout
+    elif worker is not None:
+        # Comes back with every line already segmented. None if the worker
+        # process isn't working, so segment here instead.
+        result = worker.segment(
+            image,
+            mask_config,
+            word_whitespace_threshold=word_whitespace_threshold,
+            selection_colors=ui_options["selection_colors"]
+        )
+        timings["worker_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        if result is not None:
+            target_groups, palette, layout = result
+            if use_cache:
+                segmentation_cache.put(
+                    key, image, None, target_groups, time.monotonic(), palette, layout
+                )
+
+    if target_groups is None:
+        start = time.perf_counter()
+        mask, palette = calculate_mask_and_palette_from_config(
+            image,
+            mask_config,
+            ui_options["selection_colors"]
+        )
+        if job.cancelled:
+            return SegmentedRegion(bounding_rect, mask_config, [])
+        mask_done = time.perf_counter()
+        index = ProjectionIndex(mask)
+        if job.cancelled:
+            return SegmentedRegion(bounding_rect, mask_config, [])
+        index_done = time.perf_counter()
+        timings["mask_ms"] = round((mask_done - start) * 1000, 3)
+        timings["index_ms"] = round((index_done - mask_done) * 1000, 3)
+        # Worked out here rather than inside group_rects so it can be kept
+        # for refreshing lines in sticky mode
+        layout = estimate_text_layout(index, word_whitespace_threshold)
+        target_groups = group_rects(index, word_spacing, layout)
+        if use_cache:
+            segmentation_cache.put(
+                key, image, index, target_groups, time.monotonic(), palette, layout
+            )
+
+    if ui_options["use_underline_ui"] or ui_options["target_mode"] != "lines":
+        # These draw every word or glyph, so segment the lines here rather
+        # than on the main thread. Lines mode with the marker UI never
+        # needs them. Words and glyph clusters come from the same pass.
+        for group in target_groups:
+            group.word_rects
+    if "index_ms" in timings:
+        timings["segment_ms"] = round((time.perf_counter() - index_done) * 1000, 3)
+
+    if record_dir != "" and cached is None:
+        _record_frame(
+            record_dir,
+            image,
+            bounding_rect,
+            {
+                "mask_config": mask_config,
+                "selection_colors": ui_options["selection_colors"],
+                "word_spacing": word_spacing,
+                "target_mode": ui_options["target_mode"],
+            },
+            target_groups,
+            timings
+        )
+
+    return SegmentedRegion(bounding_rect, mask_config, target_groups, palette, layout)
+
+
+def _record_frame(record_dir: str, image: Image, bounding_rect: TalonRect,
+                  frame_settings: dict, target_groups: List[LineGroup], timings: dict):
+    global corpus_writer
+
+    if corpus_writer is None or corpus_writer.directory != record_dir:
+        if corpus_writer is not None:
+            corpus_writer.close()
+        corpus_writer = CorpusWriter(record_dir)
+
+    corpus_writer.append(
+        image,
+        (bounding_rect.x, bounding_rect.y, bounding_rect.width, bounding_rect.height),
+        frame_settings,
+        target_groups,
+        timings
+    )
+
+
+def _finish_show_job(job: ShowJob, target_regions, ui_options: dict,
+                     session: Optional[StickySession]=None):
+    """
+    Shows the UI for a finished ShowJob then runs any actions queued on it.
+    session is the StickySession to keep if the labels are sticky.
+    """
+
+    global labels_ui, show_job, sticky_session
+
+    with show_job_lock:
+        if job.cancelled or show_job is not job:
+            return
+        show_job = None
+
+        if target_regions is None:
+            # Segmentation failed, drop any queued actions along with the tag
+            ctx.tags = []
+            return
+
+        labels_ui = create_labels_ui(target_regions, ui_options)
+        labels_ui.show()
+        sticky_session = session
+
+        for action_name, args in job.queued_actions:
+            getattr(actions.user, action_name)(*args)
+
+
+def _start_sticky_refresh(job: ShowJob, session: StickySession):
+    """
+    Captures the lines acted on in a sticky session again, once the
+    application has repainted, then masks and segments them on a worker
+    thread. Only the lines' rows are captured and looked at.
+    """
+
+    with show_job_lock:
+        if job.cancelled or show_job is not job:
+            return
+
+    touched = session.touched
+    session.touched = []
+    if sticky_session is not session or len(touched) == 0:
+        _finish_sticky_refresh(job, session, None)
+        return
+
+    top = min(span[0] for span in touched)
+    bottom = max(span[1] for span in touched)
+    strips = [_capture_lines(region, top, bottom) for region in session.regions]
+
+    threading.Thread(
+        target=_run_sticky_refresh,
+        args=(job, session, strips),
+        daemon=True
+    ).start()
+
+
+def _capture_lines(region: SegmentedRegion, top: float,
+                   bottom: float) -> Optional[Tuple[int, int, Image]]:
+    """
+    Captures the rows of the region's lines overlapping the screen span top
+    to bottom. Returns the first and last of those lines and the capture, or
+    None if there aren't any.
+    """
+
+    bounding_rect = region.bounding_rect
+    target_groups = region.groups
+    rel_top = top - bounding_rect.y
+    rel_bottom = bottom - bounding_rect.y
+    touched = [
+        i
+        for i, group in enumerate(target_groups)
+        if group.line_rect.y1 < rel_bottom and group.line_rect.y2 > rel_top
+    ]
+    if len(touched) == 0 or region.palette is None:
+        return None
+
+    first, last = touched[0], touched[-1]
+    y1 = target_groups[first].line_rect.y1
+    y2 = target_groups[last].line_rect.y2
+    strip = screencap_to_image(TalonRect(
+        bounding_rect.x,
+        bounding_rect.y + y1,
+        bounding_rect.width,
+        y2 - y1
+    ))
+
+    return first, last, strip
+
+
+def _run_sticky_refresh(job: ShowJob, session: StickySession,
+                        strips: List[Optional[Tuple[int, int, Image]]]):
+    """
+    Worker thread half of a sticky refresh. strips are the captures from
+    _capture_lines for each of the session's regions.
+    """
+
+    regions = []
+    for region, strip in zip(session.regions, strips):
+        if strip is None or job.cancelled:
+            regions.append(region)
+            continue
+
+        try:
+            regions.append(_refresh_lines(region, *strip, session.word_spacing))
+        except Exception:
+            traceback.print_exc()
+            regions.append(region)
+
+    if not job.cancelled:
+        cron.after("0ms", lambda: _finish_sticky_refresh(job, session, regions))
+
+
+def _finish_sticky_refresh(job: ShowJob, session: StickySession,
+                           regions: Optional[List[SegmentedRegion]]):
+    """
+    Shows the labels of a sticky session again, with the given refreshed
+    regions if there are any, then runs any actions queued on the refresh.
+    """
+
+    global labels_ui, show_job
+
+    with show_job_lock:
+        if job.cancelled or show_job is not job:
+            return
+        show_job = None
+
+        if sticky_session is not session or labels_ui is None:
+            # Hidden or shown afresh in the meantime
+            return
+
+        if regions is not None:
+            session.regions = regions
+            new_labels_ui = create_labels_ui(session.target_regions, session.ui_options, labels_ui)
+            labels_ui.destroy()
+            labels_ui = new_labels_ui
+        labels_ui.show()
+
+        for action_name, args in job.queued_actions:
+            getattr(actions.user, action_name)(*args)
+
+
+def _refresh_lines(region: SegmentedRegion, first: int, last: int, strip: Image,
+                   word_spacing: int) -> SegmentedRegion:
+    """
+    Segments the region's lines first to last again from strip, a new
+    capture of their rows, returning the region with their groups replaced.
+    The strip is masked with the region's background palette and segmented
+    with its text layout, so the rest of the region isn't looked at.
+    """
+
+    target_groups = region.groups
+    y1 = target_groups[first].line_rect.y1
+    # Just these few lines have too little to go on to find the grid or word
+    # spacing themselves
+    strip_groups = calculate_grouped_rects(
+        region.palette.mask(strip, y1),
+        word_whitespace_threshold=None if word_spacing == -1 else word_spacing,
+        layout=region.layout
+    )
+
+    return SegmentedRegion(
+        region.bounding_rect,
+        region.mask_config,
+        (
+            target_groups[:first] +
+            SegmentHierarchy(strip_groups).to_groups(dy=y1) +
+            target_groups[last + 1:]
+        ),
+        region.palette,
+        region.layout
+    )
+
+
+def _queue_if_pending(action_name: str, args: tuple, behind_others: bool=False) -> bool:
+    """
+    Queues the given telector action to be run once the in-flight ShowJob
+    finishes. Returns False if there's no ShowJob so the action should run
+    now. If behind_others is True the action is only queued when there are
+    already other actions queued.
+    """
+
+    with show_job_lock:
+        if show_job is None:
+            return False
+        if behind_others and len(show_job.queued_actions) == 0:
+            return False
+
+        show_job.queued_actions.append((action_name, args))
+        return True
+
+
+def _fixed_input_delay():
+    delay_ms = setting_input_delay.get()
+    return None if delay_ms == -1 else delay_ms / 1000
+
+
+def _cancel_show_job():
+    global show_job
+
+    with show_job_lock:
+        if show_job is not None:
+            show_job.cancelled = True
+            show_job = None
+
 
 # Debugging stuff, enable by the setting "user.selector_debug_mode = 1"
 
 debug_canvas = None
 debug_bounding_rect = None
 debug_grouped_rects = None
+# The capture settings, pixels and ProjectionIndex from the last debug
+# capture. Lets changes to settings like word spacing skip masking the
+# screen again if it hasn't changed.
+debug_capture_key = None
+debug_index = None
 
 def _debug_draw(canvas):
     global debug_bounding_rect, debug_grouped_rects
@@ -453,18 +1543,14 @@ def _debug_draw(canvas):
     canvas.draw_rect(debug_bounding_rect)
     paint.color = 'red'
     for line in debug_grouped_rects:
-        for rect in line["word_rects"]:
+        for rect in line.word_rects:
             # skia canvas positions are always relative to the screen
-            canvas.draw_rect(TalonRect(
-                debug_bounding_rect.x + rect.x1,
-                debug_bounding_rect.y + rect.y1,
-                rect.x2 - rect.x1,
-                rect.y2 - rect.y1
-            ))
+            canvas.draw_rect(to_talon_rect(debug_bounding_rect, rect))
 
 
 def _debug_helper(*args):
-    global debug_canvas, debug_bounding_rect, debug_grouped_rects
+    global debug_canvas, debug_bounding_rect, debug_grouped_rects, \
+        debug_capture_key, debug_index
     if debug_canvas:
         # Destroy all debugging stuff on settings change, we'll rebuild it if
         # neccessary in _debug_recapture_rects
@@ -479,10 +1565,29 @@ def _debug_helper(*args):
         return
 
     debug_bounding_rect = find_bounding_rect()
-    debug_grouped_rects = find_grouped_rects(debug_bounding_rect)
+    # Always captured again so the boxes match what's on screen now
+    image = screencap_to_image(debug_bounding_rect)
+    mask_config = resolve_mask_config(debug_bounding_rect)
+    selection_colors = find_selection_colors()
+    capture_key = (
+        segmentation_key(debug_bounding_rect, mask_config, None, selection_colors),
+        fingerprint(image),
+    )
+    if capture_key != debug_capture_key or debug_index is None:
+        debug_index = ProjectionIndex(
+            find_mask(image, debug_bounding_rect, mask_config, selection_colors)
+        )
+        debug_capture_key = capture_key
+    debug_grouped_rects = group_rects(debug_index)
     debug_canvas = canvas.Canvas.from_rect(debug_bounding_rect)
 
     debug_canvas.register("draw", _debug_draw)
 
 
-settings.register("", _debug_helper)
+def _register_debug_hooks():
+    settings.register("", _debug_helper)
+
+
+# Talon changes settings many times while loading user scripts, don't start
+# listening to them until it's done
+app.register("ready", _register_debug_hooks)
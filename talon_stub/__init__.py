@@ -0,0 +1,4 @@
+"""
+Development tools for running the Talon interface outside of Talon. Not
+actually used by Talon.
+"""
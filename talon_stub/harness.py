@@ -0,0 +1,251 @@
+"""
+Drives telector_show and telector_select end to end against the stand-in
+talon package, reporting how long each phase takes. Used by
+latency_harness.py, see there.
+"""
+
+from typing import List, Optional, Tuple
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+import types
+
+import numpy as np
+
+
+STUB_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(STUB_DIR)
+# The name talon_interface.py and friends are loaded under
+PACKAGE_NAME = "telector"
+# The phases which make up a voice command, from telector_show being called
+# to the labels being hidden again
+END_TO_END_PHASES = (
+    "show_call_ms",
+    "segment_ms",
+    "ui_build_ms",
+    "draw_ms",
+    "select_ms",
+    "hide_ms",
+)
+
+
+def load_talon_interface():
+    """
+    Puts the stand-in talon package on the path, then loads
+    talon_interface.py as part of a package like Talon does, so its relative
+    imports work. Returns the (stand-in talon, talon_interface) modules.
+    """
+
+    if "talon" not in sys.modules:
+        sys.path.insert(0, STUB_DIR)
+    talon = importlib.import_module("talon")
+    if not hasattr(talon, "cron") or not hasattr(talon.screen, "set_image"):
+        raise RuntimeError("The real talon package was imported instead of the stand-in")
+
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE_NAME] = package
+
+    return talon, importlib.import_module(f"{PACKAGE_NAME}.talon_interface")
+
+
+def synthetic_text(width: int, height: int, word_count: int, seed: int=0) -> Tuple[np.ndarray, int]:
+    """
+    An RGB image of dark glyph-like blocks on white, laid out in lines of
+    words. Returns the image and the number of words that fitted.
+    """
+
+    rng = np.random.default_rng(seed)
+    data = np.full((height, width, 3), 255, dtype=np.uint8)
+    margin = 10
+    line_height = 18
+    placed = 0
+    y = margin
+    while placed < word_count and y + line_height <= height - margin:
+        x = margin
+        while placed < word_count:
+            glyph_widths = rng.integers(3, 8, size=rng.integers(2, 9))
+            word_width = int(glyph_widths.sum()) + 2 * (len(glyph_widths) - 1)
+            if x + word_width > width - margin:
+                break
+
+            for glyph_width in glyph_widths:
+                top = y + int(rng.integers(0, 4))
+                data[top:y + 12, x:x + glyph_width] = 40
+                x += int(glyph_width) + 2
+            x += 6
+            placed += 1
+        y += line_height
+
+    return data, placed
+
+
+def load_image(filename: str) -> np.ndarray:
+    from src.batch import load_image as load_batch_image
+
+    return load_batch_image(filename).data
+
+
+def run_scenario(talon, talon_interface, data: np.ndarray, options: argparse.Namespace) -> dict:
+    """
+    Shows and uses the labels repeatedly on the given screen contents,
+    returning the median time of each phase in ms.
+    """
+
+    height, width, _ = data.shape
+    talon.screen.set_image(data)
+    talon.ui.window.rect = talon.types.Rect(0, 0, width, height)
+    # Mouse fill starts from the mouse, so put it on the background
+    talon.actions.mouse_position = (width - 5, height - 5)
+    talon.settings.set("user.telector_background_detector", options.background_detector)
+    talon.settings.set("user.telector_target_mode", options.target_mode)
+    talon.settings.set("user.telector_input_delay", 0)
+    talon.settings.set("user.telector_label_order", options.label_order)
+    if options.ui == "underline":
+        talon.registry.tags.add("user.telector_ui_underline")
+    else:
+        talon.registry.tags.discard("user.telector_ui_underline")
+
+    phases = {}
+    labels = 0
+    draw_calls = 0
+
+    def _record(name, seconds):
+        phases.setdefault(name, []).append(seconds * 1000)
+
+    for _ in range(options.repeats):
+        # Every show should do the full capture and segmentation
+        talon_interface.segmentation_cache.clear()
+
+        start = time.perf_counter()
+        talon_interface.find_regions()
+        _record("settings_ms", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        talon.actions.user.telector_show()
+        show_returned = time.perf_counter()
+        if not talon.cron.wait():
+            raise RuntimeError("telector_show didn't finish")
+        worker_done = time.perf_counter()
+        talon.cron.run_pending()
+        ui_done = time.perf_counter()
+
+        labels_ui = talon_interface.labels_ui
+        if labels_ui is None:
+            raise RuntimeError("telector_show didn't show any labels")
+        draw_seconds = labels_ui.can.draw_seconds
+        draw_calls = len(labels_ui.can.draw_calls)
+        _record("show_call_ms", show_returned - start)
+        _record("segment_ms", worker_done - show_returned)
+        _record("ui_build_ms", ui_done - worker_done - draw_seconds)
+        _record("draw_ms", draw_seconds)
+
+        first, last = _select_labels(labels_ui)
+        labels = _count_labels(labels_ui)
+        start = time.perf_counter()
+        talon.actions.user.telector_select(first, last)
+        _record("select_ms", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        talon.actions.user.telector_hide()
+        _record("hide_ms", time.perf_counter() - start)
+        _record("total_ms", sum(
+            phases[name][-1]
+            for name in END_TO_END_PHASES
+        ) / 1000)
+
+    return {
+        "size": [width, height],
+        "ui": options.ui,
+        "target_mode": options.target_mode,
+        "labels": labels,
+        "draw_calls": draw_calls,
+        "timings": {
+            name: round(statistics.median(values), 3)
+            for name, values in phases.items()
+        },
+    }
+
+
+def _select_labels(labels_ui) -> Tuple[str, str]:
+    """
+    A label near the start and one a little further on to select between
+    """
+
+    if hasattr(labels_ui, "markers"):
+        markers = labels_ui.markers
+        return markers[0].label, markers[min(5, len(markers) - 1)].label
+
+    groups = labels_ui.groups
+    return f"{groups[0].label}1", f"{groups[min(1, len(groups) - 1)].label}1"
+
+
+def _count_labels(labels_ui) -> int:
+    if hasattr(labels_ui, "markers"):
+        return len(labels_ui.markers)
+
+    return sum(len(group.item_rects) for group in labels_ui.groups)
+
+
+def _parse_size(value: str) -> Tuple[int, int]:
+    width, _, height = value.partition("x")
+    return int(width), int(height)
+
+
+def main(argv: Optional[List[str]]=None):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Measures telector_show and telector_select end to end using a "
+            "stand-in for Talon, printing the median time of each phase as "
+            "JSON lines."
+        )
+    )
+    parser.add_argument(
+        "--images",
+        nargs="+",
+        default=[],
+        help="Screenshots to use as the screen, instead of synthetic text"
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=_parse_size,
+        default=[(800, 600), (1600, 1000), (2560, 1440)],
+        metavar="WIDTHxHEIGHT",
+        help="Window sizes for synthetic text"
+    )
+    parser.add_argument(
+        "--words",
+        nargs="+",
+        type=int,
+        default=[100, 400, 1600],
+        help="Word counts for synthetic text, capped by what fits"
+    )
+    parser.add_argument("--ui", choices=("marker", "underline"), default="marker")
+    parser.add_argument("--target-mode", choices=("lines", "words", "chars"), default="words")
+    parser.add_argument("--background-detector", default="mouse_fill")
+    parser.add_argument("--label-order", choices=("reading", "proximity"), default="reading")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    talon, talon_interface = load_talon_interface()
+
+    scenarios = []
+    for filename in args.images:
+        scenarios.append(({"image": filename}, load_image(filename)))
+    if len(args.images) == 0:
+        for width, height in args.sizes:
+            for word_count in args.words:
+                data, placed = synthetic_text(width, height, word_count)
+                scenarios.append(({"words": placed}, data))
+
+    for description, data in scenarios:
+        result = run_scenario(talon, talon_interface, data, args)
+        sys.stdout.write(json.dumps({**description, **result}) + "\n")
+        sys.stdout.flush()
@@ -0,0 +1,318 @@
+"""
+A minimal stand-in for Talon's python API, enough to load and drive
+talon_interface.py outside of Talon. Screen captures come from an image set
+with screen.set_image, and everything drawn on a canvas is recorded rather
+than displayed.
+
+Only used by the latency harness (see latency_harness.py). Talon itself
+never imports this as `talon`, so loading it as a user script does nothing.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import threading
+import time
+
+import numpy as np
+
+from .types import Rect
+
+
+class _Actions:
+    """
+    The actions namespace. User actions are added by Module.action_class,
+    the built in mouse and key actions just record what they were asked to
+    do in events.
+    """
+
+    def __init__(self):
+        self.user = _UserActions()
+        self.events: List[tuple] = []
+        self.mouse_position = (0, 0)
+
+    def key(self, key: str):
+        self.events.append(("key", key))
+
+    def mouse_x(self):
+        return self.mouse_position[0]
+
+    def mouse_y(self):
+        return self.mouse_position[1]
+
+    def mouse_move(self, x, y):
+        self.mouse_position = (x, y)
+        self.events.append(("mouse_move", x, y))
+
+    def mouse_click(self, button: int=0):
+        self.events.append(("mouse_click", button))
+
+    def mouse_drag(self, button: int=0):
+        self.events.append(("mouse_drag", button))
+
+    def mouse_release(self, button: int=0):
+        self.events.append(("mouse_release", button))
+
+
+class _UserActions:
+    pass
+
+
+class _App:
+    def __init__(self):
+        self.handlers: Dict[str, List[Callable]] = {}
+
+    def register(self, event: str, handler: Callable):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def fire(self, event: str):
+        for handler in self.handlers.get(event, []):
+            handler()
+
+
+class _Screen:
+    def __init__(self, rect: Rect):
+        self.rect = rect
+        self.image = None
+
+    def set_image(self, data: np.ndarray):
+        """
+        Sets the RGB image captures are served from. It covers the whole
+        screen, which is resized to match.
+        """
+
+        height, width, _ = data.shape
+        alpha = np.full((height, width, 1), 255, dtype=np.uint8)
+        self.image = np.concatenate((data, alpha), axis=2)
+        self.rect = Rect(0, 0, width, height)
+
+    def capture(self, x, y, width, height) -> np.ndarray:
+        """
+        An RGBA capture like Talon's, which also converts to a numpy array
+        """
+
+        x, y, width, height = int(x), int(y), int(width), int(height)
+        return self.image[y:y + height, x:x + width]
+
+
+class _Window:
+    def __init__(self, rect: Rect):
+        self.rect = rect
+
+
+class _AppInfo:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class _Ui:
+    def __init__(self):
+        self.window = _Window(Rect(0, 0, 0, 0))
+        self.app = _AppInfo("harness")
+
+    def screens(self):
+        return [screen]
+
+    def active_window(self):
+        return self.window
+
+    def active_app(self):
+        return self.app
+
+
+class _Paint:
+    class Style:
+        FILL = "fill"
+        STROKE = "stroke"
+
+    # Roughly a 12px monospace font
+    CHAR_WIDTH = 7
+    CHAR_HEIGHT = 9
+
+    def __init__(self):
+        self.style = self.Style.FILL
+        self.color = "black"
+        self.textsize = 12
+        self.typeface = None
+        self.stroke_width = 1
+
+    def measure_text(self, text: str) -> Tuple[float, Rect]:
+        width = len(text) * self.CHAR_WIDTH
+        return width, Rect(0, -self.CHAR_HEIGHT, width, self.CHAR_HEIGHT)
+
+
+class _SkiaCanvas:
+    """
+    What draw callbacks are given. Records every draw call.
+    """
+
+    def __init__(self, draw_calls: list):
+        self.paint = _Paint()
+        self.draw_calls = draw_calls
+
+    def draw_rect(self, rect: Rect):
+        self.draw_calls.append(("rect", rect.x, rect.y, rect.width, rect.height))
+
+    def draw_line(self, x1, y1, x2, y2):
+        self.draw_calls.append(("line", x1, y1, x2, y2))
+
+    def draw_text(self, text: str, x, y):
+        self.draw_calls.append(("text", text, x, y))
+
+
+class Canvas:
+    """
+    A canvas which runs its draw callbacks once when shown, recording the
+    calls made and how long they took.
+    """
+
+    # Every canvas created, so the harness can inspect them
+    created: List["Canvas"] = []
+
+    def __init__(self, rect: Rect):
+        self.rect = rect
+        self.handlers: List[Callable] = []
+        self.visible = False
+        self.closed = False
+        self.draw_calls: List[tuple] = []
+        self.draw_seconds = 0.0
+        Canvas.created.append(self)
+
+    @classmethod
+    def from_rect(cls, rect: Rect) -> "Canvas":
+        return cls(rect)
+
+    @classmethod
+    def from_screen(cls, screen_: _Screen) -> "Canvas":
+        return cls(screen_.rect)
+
+    def register(self, event: str, handler: Callable):
+        if event == "draw":
+            self.handlers.append(handler)
+
+    def unregister(self, event: str, handler: Callable):
+        if event == "draw" and handler in self.handlers:
+            self.handlers.remove(handler)
+
+    def show(self):
+        self.visible = True
+        self.draw_calls = []
+        start = time.perf_counter()
+        skia_canvas = _SkiaCanvas(self.draw_calls)
+        for handler in self.handlers:
+            handler(skia_canvas)
+        self.draw_seconds = time.perf_counter() - start
+
+    def hide(self):
+        self.visible = False
+
+    def freeze(self):
+        pass
+
+    def close(self):
+        self.visible = False
+        self.closed = True
+
+
+class _CanvasModule:
+    Canvas = Canvas
+
+
+class _Cron:
+    """
+    Talon runs cron callbacks on its main thread. Here they're queued until
+    run_pending is called.
+    """
+
+    def __init__(self):
+        self._pending: List[Callable] = []
+        self._condition = threading.Condition()
+
+    def after(self, delay: str, callback: Callable):
+        with self._condition:
+            self._pending.append(callback)
+            self._condition.notify_all()
+
+    def wait(self, timeout: float=10.0) -> bool:
+        """
+        Waits for a callback to be queued. Returns False on timeout.
+        """
+
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._pending) > 0, timeout)
+
+    def run_pending(self):
+        with self._condition:
+            pending = self._pending
+            self._pending = []
+
+        for callback in pending:
+            callback()
+
+
+class _Registry:
+    def __init__(self):
+        self.tags = set()
+
+
+class _SettingHandle:
+    def __init__(self, name: str, default):
+        self.name = name
+        self.default = default
+
+    def get(self):
+        return settings.get(self.name, self.default)
+
+
+class _Settings:
+    def __init__(self):
+        self.values: Dict[str, object] = {}
+        self.handlers: List[Callable] = []
+
+    def get(self, name: str, default=None):
+        return self.values.get(name, default)
+
+    def set(self, name: str, value):
+        self.values[name] = value
+        for handler in self.handlers:
+            handler(name, value)
+
+    def register(self, topic: str, handler: Callable):
+        self.handlers.append(handler)
+
+
+class _Ctrl:
+    def mouse_pos(self) -> Tuple[float, float]:
+        return actions.mouse_position
+
+
+class Module:
+    def setting(self, name: str, type=None, desc: str="", default=None) -> _SettingHandle:
+        return _SettingHandle(f"user.{name}", default)
+
+    def tag(self, name: str, desc: str=""):
+        pass
+
+    def action_class(self, cls):
+        for name, value in vars(cls).items():
+            if callable(value) and not name.startswith("_"):
+                setattr(actions.user, name, value)
+
+        return cls
+
+
+class Context:
+    def __init__(self):
+        self.matches = ""
+        self.tags: List[str] = []
+        self.settings: Dict[str, object] = {}
+
+
+actions = _Actions()
+app = _App()
+screen = _Screen(Rect(0, 0, 1920, 1080))
+ui = _Ui()
+canvas = _CanvasModule()
+cron = _Cron()
+registry = _Registry()
+settings = _Settings()
+ctrl = _Ctrl()
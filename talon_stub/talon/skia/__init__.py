@@ -0,0 +1,3 @@
+"""
+Stand-in for talon.skia
+"""
@@ -0,0 +1,7 @@
+"""
+Stand-in for talon.skia.bitmap
+"""
+
+
+class Bitmap:
+    pass
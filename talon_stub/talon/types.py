@@ -0,0 +1,38 @@
+"""
+Stand-in for talon.types
+"""
+
+
+class Rect:
+    """
+    A screen rect, with the same attributes as Talon's
+    """
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    @property
+    def left(self):
+        return self.x
+
+    @property
+    def top(self):
+        return self.y
+
+    @property
+    def right(self):
+        return self.x + self.width
+
+    @property
+    def bot(self):
+        return self.y + self.height
+
+    def __eq__(self, other):
+        return isinstance(other, Rect) and \
+            (self.x, self.y, self.width, self.height) == (other.x, other.y, other.width, other.height)
+
+    def __repr__(self):
+        return f"Rect({self.x}, {self.y}, {self.width}, {self.height})"